@@ -1,5 +1,28 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Car, Order, CarCategory, Review, Favorite, UserProfile
+from django.core.cache import cache
+from .models import Car, Order, CarCategory, Review, Favorite, UserProfile, Job
+from . import reports
+from .pagination import EstimatedCountPaginator
+
+
+class CachedValuesListFilter(admin.AllValuesFieldListFilter):
+    """Фильтр по значениям поля, список значений (SELECT DISTINCT) берётся из кеша."""
+    
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        key = f'admin:filter:{model._meta.label}:{field_path}'
+        choices = cache.get(key)
+        if choices is None:
+            choices = list(self.lookup_choices)
+            cache.set(key, choices, settings.ADMIN_FILTER_CACHE_TIMEOUT)
+        self.lookup_choices = choices
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Без второго COUNT(*) по всей таблице и с оценкой числа строк на PostgreSQL."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(CarCategory)
@@ -9,14 +32,19 @@ class CarCategoryAdmin(admin.ModelAdmin):
 
 
 @admin.register(Car)
-class CarAdmin(admin.ModelAdmin):
+class CarAdmin(LargeTableAdmin):
     list_display = ['name', 'brand', 'model', 'year', 'category', 'price_per_day', 'available', 'rating']
-    list_filter = ['brand', 'year', 'available', 'category', 'fuel_type', 'transmission']
-    search_fields = ['name', 'brand', 'model']
+    list_select_related = ['category']
+    list_filter = [
+        ('brand', CachedValuesListFilter), ('year', CachedValuesListFilter),
+        'available', 'category', 'fuel_type', 'transmission',
+    ]
+    search_fields = ['name', 'brand', 'model', '=external_id']
     prepopulated_fields = {'slug': ('brand', 'model', 'year')}
+    readonly_fields = ['favorites_count']
     fieldsets = (
         ('Основная информация', {
-            'fields': ('name', 'brand', 'model', 'year', 'category', 'slug', 'description')
+            'fields': ('name', 'brand', 'model', 'year', 'category', 'slug', 'external_id', 'description')
         }),
         ('Цены', {
             'fields': ('price_per_day', 'price_per_hour')
@@ -31,14 +59,22 @@ class CarAdmin(admin.ModelAdmin):
             'fields': ('air_conditioning', 'gps', 'bluetooth', 'parking_sensors', 'reverse_camera')
         }),
         ('Статус и рейтинг', {
-            'fields': ('available', 'rating', 'reviews_count')
+            'fields': ('available', 'rating', 'reviews_count', 'favorites_count')
         }),
     )
 
 
+@admin.action(description='Выгрузить в CSV')
+def export_orders_csv(modeladmin, request, queryset):
+    return reports.orders_csv_response(queryset)
+
+
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
+    actions = [export_orders_csv]
     list_display = ['id', 'user', 'car', 'start_date', 'end_date', 'status', 'total_price', 'created_at']
+    list_select_related = ['user', 'car']
+    raw_id_fields = ['user', 'car']
     list_filter = ['status', 'created_at', 'start_date', 'end_date']
     search_fields = ['user__username', 'car__name', 'phone', 'email']
     readonly_fields = ['created_at', 'updated_at']
@@ -66,22 +102,36 @@ class OrderAdmin(admin.ModelAdmin):
 
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(LargeTableAdmin):
     list_display = ['user', 'car', 'rating', 'created_at']
+    list_select_related = ['user', 'car']
+    raw_id_fields = ['user', 'car', 'order']
     list_filter = ['rating', 'created_at']
     search_fields = ['user__username', 'car__name', 'comment']
     readonly_fields = ['created_at']
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdmin):
     list_display = ['user', 'car', 'created_at']
+    list_select_related = ['user', 'car']
+    raw_id_fields = ['user', 'car']
     list_filter = ['created_at']
     search_fields = ['user__username', 'car__name']
 
 
 @admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
+class UserProfileAdmin(LargeTableAdmin):
     list_display = ['user', 'phone', 'driver_license', 'created_at']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
     search_fields = ['user__username', 'phone', 'driver_license']
     readonly_fields = ['created_at']
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_at', 'locked_by', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'idempotency_key']
+    readonly_fields = ['created_at', 'finished_at', 'locked_at', 'locked_by', 'last_error']
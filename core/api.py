@@ -0,0 +1,251 @@
+"""
+Публичное JSON API каталога, только чтение (/api/v1/).
+
+Фильтры списка машин - те же, что у CarSearchForm на главной, плюс
+sort (ключи catalogue.ORDERINGS) и cursor (core.pagination).
+?fields=id,brand,price_per_day ограничивает и ответ, и колонки запроса
+(.only()). Ответы отдаются со строгим ETag, и If-None-Match с тем же
+значением получает 304. ETag списка машин строится из поколения
+каталога (catalogue.generation(), сдвигается сигналами Car, Review и
+CarCategory) без запросов к базе; ETag одной машины - из updated_at и
+счётчиков рейтинга и избранного, которые меняются без save().
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition, require_GET
+
+from . import catalogue, favorites, page_cache
+from .forms import CarSearchForm
+from .models import Car, CarCategory, Review
+from .pagination import CursorPaginator
+
+VERSION = 'v1'
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Поле ответа -> поля модели, нужные для него
+CAR_FIELDS = {
+    'id': ('id',),
+    'name': ('name',),
+    'brand': ('brand',),
+    'model': ('model',),
+    'year': ('year',),
+    'category': ('category_id',),
+    'price_per_day': ('price_per_day',),
+    'price_per_hour': ('price_per_hour',),
+    'available': ('available',),
+    'description': ('description',),
+    'fuel_type': ('fuel_type',),
+    'transmission': ('transmission',),
+    'seats': ('seats',),
+    'doors': ('doors',),
+    'engine_volume': ('engine_volume',),
+    'power': ('power',),
+    'air_conditioning': ('air_conditioning',),
+    'gps': ('gps',),
+    'bluetooth': ('bluetooth',),
+    'parking_sensors': ('parking_sensors',),
+    'reverse_camera': ('reverse_camera',),
+    'slug': ('slug',),
+    'rating': ('rating',),
+    'reviews_count': ('reviews_count',),
+    'favorites_count': ('favorites_count',),
+    'image': ('image',),
+    'updated_at': ('updated_at',),
+    'url': ('id', 'slug'),
+}
+DEFAULT_LIST_FIELDS = (
+    'id', 'name', 'brand', 'model', 'year', 'category', 'price_per_day', 'available',
+    'fuel_type', 'transmission', 'seats', 'rating', 'reviews_count', 'image', 'url',
+)
+
+REVIEW_ORDERING = ('-created_at', '-id')
+
+
+class BadRequest(Exception):
+    pass
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def requested_fields(request, default=tuple(CAR_FIELDS)):
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(default)
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in CAR_FIELDS]
+    if unknown:
+        raise BadRequest(f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+
+def model_fields(fields, ordering=()):
+    names = {'id'}
+    for name in fields:
+        names.update(CAR_FIELDS[name])
+    names.update(name.lstrip('-') for name in ordering)
+    return sorted(names)
+
+
+def serialize_car(request, car, fields):
+    data = {}
+    for name in fields:
+        if name == 'category':
+            data[name] = car.category_id
+        elif name == 'image':
+            data[name] = request.build_absolute_uri(car.image.url) if car.image else None
+        elif name == 'url':
+            data[name] = request.build_absolute_uri(car.get_absolute_url())
+        else:
+            # Decimal и даты сериализует DjangoJSONEncoder в JsonResponse
+            data[name] = getattr(car, name)
+    return data
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr((VERSION,) + parts).encode()).hexdigest()
+
+
+def _car_list_query(request):
+    form = CarSearchForm(request.GET)
+    if not form.is_valid():
+        raise BadRequest(form.errors.get_json_data())
+    cars = form.filter_cars(Car.objects.filter(available=True))
+    ordering = catalogue.ORDERINGS.get(request.GET.get('sort', 'created_at'))
+    if ordering is None:
+        raise BadRequest(f'sort: одно из {", ".join(catalogue.ORDERINGS)}')
+    return form, cars, ordering
+
+
+def car_list_etag(request):
+    try:
+        form, cars, _ = _car_list_query(request)
+    except BadRequest:
+        return None
+    # Бронирования меняют доступность на даты, не трогая Car
+    occupancy = page_cache.tag_versions([page_cache.OCCUPANCY]) if form.rental_days else None
+    # Счётчик избранного не сдвигает поколение каталога
+    favorites_version = favorites.counts_version() if 'favorites_count' in request.GET.get('fields', '') else None
+    return make_etag(request.get_full_path(), catalogue.generation(), occupancy, favorites_version)
+
+
+def car_detail_etag(request, pk):
+    state = Car.objects.filter(pk=pk).values_list(
+        'updated_at', 'rating_sum', 'reviews_count', 'favorites_count',
+    ).first()
+    if state is None:
+        return None
+    return make_etag(request.get_full_path(), *state)
+
+
+def reviews_etag(request, pk):
+    state = Review.objects.filter(car_id=pk).aggregate(
+        last_created=Max('created_at'), last_updated=Max('updated_at'), last_id=Max('id'), total=Count('id'),
+    )
+    return make_etag(
+        request.get_full_path(), state['last_created'], state['last_updated'], state['last_id'], state['total'],
+    )
+
+
+def categories_etag(request):
+    return make_etag(request.get_full_path(), categories_payload())
+
+
+def categories_payload():
+    counts = {category['id']: category['car_count'] for category in catalogue.get_snapshot()['categories']}
+    return [
+        {**category, 'car_count': counts.get(category['id'], 0)}
+        for category in CarCategory.objects.order_by('name').values('id', 'name', 'description')
+    ]
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise BadRequest('limit должен быть числом')
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def page_links(request, page):
+    def link(cursor):
+        if cursor is None:
+            return None
+        params = request.GET.copy()
+        params['cursor'] = cursor
+        return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+    return {'next': link(page.next_cursor), 'previous': link(page.previous_cursor)}
+
+
+def api_response(data):
+    response = JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+    # Клиент может хранить ответ, но перед использованием сверяет ETag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@require_GET
+@condition(etag_func=car_list_etag)
+def car_list(request):
+    try:
+        _, cars, ordering = _car_list_query(request)
+        fields = requested_fields(request, DEFAULT_LIST_FIELDS)
+        size = page_size(request)
+    except BadRequest as exc:
+        return error(exc.args[0])
+    paginator = CursorPaginator(cars.only(*model_fields(fields, ordering)), size, ordering)
+    page = paginator.get_page(request.GET.get('cursor'))
+    return api_response({
+        'results': [serialize_car(request, car, fields) for car in page],
+        **page_links(request, page),
+    })
+
+
+@require_GET
+@condition(etag_func=car_detail_etag)
+def car_detail(request, pk):
+    try:
+        fields = requested_fields(request)
+    except BadRequest as exc:
+        return error(exc.args[0])
+    car = get_object_or_404(Car.objects.only(*model_fields(fields)), pk=pk)
+    return api_response(serialize_car(request, car, fields))
+
+
+@require_GET
+@condition(etag_func=reviews_etag)
+def car_reviews(request, pk):
+    get_object_or_404(Car.objects.only('id'), pk=pk)
+    try:
+        size = page_size(request)
+    except BadRequest as exc:
+        return error(exc.args[0])
+    reviews = Review.objects.filter(car_id=pk).select_related('user').only(
+        'rating', 'comment', 'created_at', 'car_id',
+        'user__username', 'user__first_name', 'user__last_name',
+    )
+    page = CursorPaginator(reviews, size, REVIEW_ORDERING).get_page(request.GET.get('cursor'))
+    return api_response({
+        'results': [
+            {
+                'id': review.pk,
+                'rating': review.rating,
+                'comment': review.comment,
+                'author': review.user.get_full_name() or review.user.username,
+                'created_at': review.created_at,
+            }
+            for review in page
+        ],
+        **page_links(request, page),
+    })
+
+
+@require_GET
+@condition(etag_func=categories_etag)
+def categories(request):
+    return api_response({'results': categories_payload()})
@@ -0,0 +1,28 @@
+from django.db import transaction
+
+from .models import Car, Order
+
+
+class CarUnavailable(Exception):
+    """Автомобиль уже забронирован на пересекающийся период."""
+
+
+def is_available(car, start, end):
+    return not Order.objects.overlapping(start, end, car=car).exists()
+
+
+def reserve(order):
+    """
+    Сохраняет заказ, если автомобиль свободен на его даты.
+
+    Строка автомобиля блокируется через SELECT ... FOR UPDATE, поэтому
+    параллельные бронирования одной машины выполняются по очереди и
+    второе из пересекающихся получает CarUnavailable. На SQLite ту же
+    роль играет транзакция в режиме IMMEDIATE (см. DATABASES в settings).
+    """
+    with transaction.atomic():
+        Car.objects.select_for_update().only('pk').get(pk=order.car_id)
+        if not is_available(order.car_id, order.start_date, order.end_date):
+            raise CarUnavailable
+        order.save()
+    return order
@@ -0,0 +1,82 @@
+import json
+import statistics
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def measure(fn, repeat):
+    """Вызывает fn repeat раз и возвращает отсортированные времена в миллисекундах."""
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings.sort()
+    return timings
+
+
+def summary(timings):
+    return (
+        f'mean={statistics.mean(timings):.3f} p50={percentile(timings, 0.50):.3f} '
+        f'p95={percentile(timings, 0.95):.3f} p99={percentile(timings, 0.99):.3f}'
+    )
+
+
+def measure_requests(send, repeat):
+    """Вызывает send() repeat раз; возвращает времена в мс (по возрастанию) и число SQL на каждый вызов."""
+    timings = []
+    queries = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            t0 = time.perf_counter()
+            send()
+            timings.append((time.perf_counter() - t0) * 1000)
+        queries.append(len(captured))
+    timings.sort()
+    return timings, queries
+
+
+def request_stats(timings, queries):
+    return {
+        'p50': round(percentile(timings, 0.50), 3),
+        'p95': round(percentile(timings, 0.95), 3),
+        'p99': round(percentile(timings, 0.99), 3),
+        'queries': round(statistics.mean(queries), 2),
+        'max_queries': max(queries),
+    }
+
+
+def save_baseline(path, results, **meta):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({**meta, 'results': results}, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Сценарии хуже базовой линии: p95 выросло больше чем на tolerance (доля)
+    или стало больше SQL-запросов. Сценарии без базовой линии пропускаются.
+    """
+    found = {}
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        problems = []
+        if current['p95'] > base['p95'] * (1 + tolerance):
+            problems.append(f"p95 {base['p95']:.1f} -> {current['p95']:.1f} мс")
+        if current['queries'] > base['queries']:
+            problems.append(f"SQL {base['queries']:g} -> {current['queries']:g}")
+        if problems:
+            found[name] = problems
+    return found
@@ -0,0 +1,125 @@
+"""
+Снимок каталога для главной страницы: число доступных автомобилей,
+категории с количеством машин и рекомендуемые автомобили. Здесь же
+порядки сортировки каталога (общие для главной и API).
+
+Снимок хранится в кеше с коротким TTL и сбрасывается сигналами Car,
+Review и CarCategory (core.signals); на промахе он собирается двумя
+запросами - агрегатом по категориям и выборкой лучших по рейтингу.
+Каждый сброс сдвигает и поколение каталога (generation()), по которому
+API считает ETag списка машин без запроса к базе. Кеш в памяти процесса
+(locmem) сбросы из других воркеров не видит, поэтому с ним поколение
+дополняется версией из базы (число и последний updated_at машин и
+отзывов), которая проверяется не чаще раза в CATALOGUE_DB_CHECK_INTERVAL
+секунд.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import Count, Max
+
+from . import db_routing, metrics
+from .models import Car, Review
+
+SNAPSHOT_KEY = 'catalogue:snapshot'
+GENERATION_KEY = 'catalogue:generation'
+FEATURED_LIMIT = 3
+FEATURED_MIN_RATING = 4.0
+
+# Порядок выдачи каталога; id в конце делает его однозначным для курсора
+ORDERINGS = {
+    'created_at': ('-created_at', '-id'),
+    'price_asc': ('price_per_day', 'id'),
+    'price_desc': ('-price_per_day', '-id'),
+    'rating': ('-rating', '-id'),
+    'year': ('-year', '-id'),
+}
+
+
+def sort_cars(cars, sort_by, search_backend=None):
+    """
+    (queryset, ordering) выдачи главной. relevance сортирует по рангу
+    поиска, если поиск был и бэкенд ранжирует; иначе (и для неизвестных
+    ключей) - "сначала новые". ordering None - курсор неприменим.
+    """
+    if sort_by == 'relevance' and search_backend and search_backend.ranked:
+        return cars.order_by('-search_rank', '-created_at'), None
+    ordering = ORDERINGS.get(sort_by, ORDERINGS['created_at'])
+    return cars.order_by(*ordering), ordering
+
+
+def build_snapshot():
+    rows = (
+        Car.objects.filter(available=True)
+        .values('category_id', 'category__name')
+        .annotate(car_count=Count('id'))
+        .order_by('category__name')
+    )
+    categories = []
+    total_cars = 0
+    for row in rows:
+        total_cars += row['car_count']
+        if row['category_id'] is not None:
+            categories.append({
+                'id': row['category_id'],
+                'name': row['category__name'],
+                'car_count': row['car_count'],
+            })
+    featured_cars = list(
+        Car.objects.filter(available=True, rating__gte=FEATURED_MIN_RATING)
+        .order_by('-rating', '-id')[:FEATURED_LIMIT]
+    )
+    return {
+        'total_cars': total_cars,
+        'categories': categories,
+        'featured_cars': featured_cars,
+    }
+
+
+def get_snapshot():
+    snapshot = cache.get(SNAPSHOT_KEY)
+    metrics.cache_lookup('catalogue', snapshot is not None)
+    if snapshot is None:
+        with db_routing.use_primary():
+            snapshot = build_snapshot()
+        cache.set(SNAPSHOT_KEY, snapshot, settings.CATALOGUE_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def cache_is_local():
+    """Кеш по умолчанию не общий между воркерами: сбросы других процессов в нём не видны."""
+    return isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+_db_version = None
+_db_checked_at = None
+
+
+def _database_version():
+    global _db_version, _db_checked_at
+    now = time.monotonic()
+    if _db_checked_at is None or now - _db_checked_at >= settings.CATALOGUE_DB_CHECK_INTERVAL:
+        cars = Car.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+        reviews = Review.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+        _db_version = (cars['count'], cars['updated'], reviews['count'], reviews['updated'])
+        _db_checked_at = now
+    return _db_version
+
+
+def generation():
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        # Ключ вытеснен или ещё не создан: начинаем новое поколение
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        value = cache.get(GENERATION_KEY)
+    if cache_is_local():
+        value = (value, _database_version())
+    return value
+
+
+def invalidate():
+    cache.delete(SNAPSHOT_KEY)
+    cache.set(GENERATION_KEY, time.time_ns(), None)
@@ -0,0 +1,8 @@
+from django.utils.functional import SimpleLazyObject
+
+from .favorites import favorite_ids
+
+
+def favorites(request):
+    # Лениво: запрос к кешу/БД только если шаблон обратился к user_favorites
+    return {'user_favorites': SimpleLazyObject(lambda: favorite_ids(request.user))}
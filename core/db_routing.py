@@ -0,0 +1,86 @@
+"""
+Чтение с реплики PostgreSQL.
+
+Запросы идут на основную базу, пока ReplicaRoutingMiddleware не
+разрешит реплику: только для GET/HEAD представлений из
+DATABASE_REPLICA_VIEWS. Поэтому команды, воркеры и все записи
+остаются на основной базе. Чтения внутри транзакции тоже идут на
+основную базу, иначе select_for_update и проверки в транзакции
+увидели бы другую базу.
+
+Реплика отстаёт, поэтому после POST (бронирование, отзыв, избранное)
+клиент получает cookie и DATABASE_REPLICA_STICKY_SECONDS секунд
+читает с основной базы - видит свои изменения.
+
+То, что попадает в общие кеши (страницы для анонимов, снимок каталога,
+индекс подсказок), собирается внутри use_primary(): иначе страница,
+отрендеренная с отставшей реплики сразу после сброса тега, жила бы в
+кеше весь его TTL.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+STICKY_COOKIE = 'db_primary'
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+@contextmanager
+def use_primary():
+    """Чтения внутри блока идут на основную базу."""
+    token = _read_from_replica.set(False)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия основной базы, объекты с неё связываются свободно
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        if REPLICA not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._replica_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request._replica_token is not None:
+                _read_from_replica.reset(request._replica_token)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=settings.DATABASE_REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in ('GET', 'HEAD')
+            and STICKY_COOKIE not in request.COOKIES
+            and request.resolver_match.view_name in settings.DATABASE_REPLICA_VIEWS
+        ):
+            request._replica_token = _read_from_replica.set(True)
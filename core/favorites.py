@@ -0,0 +1,132 @@
+"""
+Множество id избранных автомобилей текущего пользователя.
+
+Загружается одним запросом, кешируется по пользователю и сбрасывается
+сигналами Favorite (core.signals), в т.ч. при toggle_favorite.
+Шаблоны получают его как user_favorites из context processor.
+
+Там же ведётся счётчик Car.favorites_count: сигналы Favorite сдвигают его
+атомарным UPDATE с F(), а toggle() и add_many() держат блокировку строк
+автомобилей, поэтому двойной клик и параллельные запросы не сбивают его.
+updated_at при этом не меняется, чтобы клик по сердечку не сбрасывал
+фрагменты карточек; для ETag списка API сдвигается counts_version()
+(с кешем в памяти процесса она берётся из базы - числом и последним id
+записей избранного). Кеш множества и версия счётчиков сбрасываются
+после коммита: иначе параллельный запрос успел бы прочитать старые
+строки и положить их в кеш на весь TTL.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max
+
+from . import metrics
+from .catalogue import cache_is_local
+from .models import Car, Favorite
+
+# Сколько машин можно добавить в избранное одним запросом
+MAX_BULK_ADD = 100
+
+
+COUNTS_VERSION_KEY = 'favorites:counts_version'
+
+
+def _cache_key(user_id):
+    return f'favorites:ids:{user_id}'
+
+
+def favorite_ids(user):
+    if not user.is_authenticated:
+        return frozenset()
+    # Запоминаем на объекте пользователя, чтобы в пределах запроса кеш читался один раз
+    ids = getattr(user, '_favorite_ids', None)
+    if ids is None:
+        key = _cache_key(user.pk)
+        ids = cache.get(key)
+        metrics.cache_lookup('favorites', ids is not None)
+        if ids is None:
+            ids = frozenset(Favorite.objects.filter(user=user).values_list('car_id', flat=True))
+            cache.set(key, ids, settings.FAVORITES_CACHE_TIMEOUT)
+        user._favorite_ids = ids
+    return ids
+
+
+def invalidate(user_id):
+    transaction.on_commit(lambda: cache.delete(_cache_key(user_id)))
+
+
+def apply_delta(car_ids, delta):
+    Car.objects.filter(pk__in=car_ids).update(favorites_count=F('favorites_count') + delta)
+    transaction.on_commit(lambda: cache.set(COUNTS_VERSION_KEY, time.time_ns(), None))
+
+
+def _delete(user, car):
+    """Удаляет запись одним DELETE, без выборки строк и сигналов; возвращает число строк."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {Favorite._meta.db_table} WHERE user_id = %s AND car_id = %s',
+            [user.pk, car.pk],
+        )
+        return cursor.rowcount
+
+
+def counts_version():
+    """Версия счётчиков избранного; меняется при каждом apply_delta()."""
+    if cache_is_local():
+        state = Favorite.objects.aggregate(count=Count('id'), last_id=Max('id'))
+        return state['count'], state['last_id']
+    return cache.get(COUNTS_VERSION_KEY, 0)
+
+
+def toggle(user, car_pk):
+    """
+    Добавляет машину в избранное или убирает её оттуда.
+
+    Возвращает (is_favorite, favorites_count) или None, если машины нет.
+    Счётчик не пересчитывается: он читается под блокировкой вместе с машиной.
+
+    Один DELETE без выборки строк, а если удалять нечего - один INSERT.
+    Оба идут в обход сигналов Favorite, поэтому счётчик и кеш обновляются
+    здесь, как в add_many().
+    """
+    with transaction.atomic():
+        car = Car.objects.select_for_update().only('pk', 'favorites_count').filter(pk=car_pk).first()
+        if car is None:
+            return None
+        if _delete(user, car):
+            apply_delta([car.pk], -1)
+            invalidate(user.pk)
+            return False, car.favorites_count - 1
+        try:
+            with transaction.atomic():
+                Favorite.objects.bulk_create([Favorite(user=user, car=car)])
+        except IntegrityError:
+            # Запись успела появиться в обход блокировки машины (например, из админки)
+            return True, car.favorites_count
+        apply_delta([car.pk], 1)
+        invalidate(user.pk)
+        return True, car.favorites_count + 1
+
+
+def add_many(user, car_ids):
+    """
+    Добавляет в избранное несколько машин разом; уже добавленные и
+    несуществующие пропускаются. Возвращает {car_id: favorites_count}
+    по всем существующим машинам из списка.
+    """
+    with transaction.atomic():
+        # Блокируем в порядке pk, чтобы параллельные запросы не взаимоблокировались
+        cars = dict(
+            Car.objects.select_for_update().filter(pk__in=car_ids).order_by('pk')
+            .values_list('pk', 'favorites_count')
+        )
+        existing = set(Favorite.objects.filter(user=user, car_id__in=cars).values_list('car_id', flat=True))
+        new_ids = [pk for pk in cars if pk not in existing]
+        if new_ids:
+            # bulk_create не шлёт сигналы, поэтому счётчик и кеш обновляются здесь
+            Favorite.objects.bulk_create(Favorite(user=user, car_id=pk) for pk in new_ids)
+            apply_delta(new_ids, 1)
+            invalidate(user.pk)
+    return {pk: count + (pk not in existing) for pk, count in cars.items()}
@@ -0,0 +1,277 @@
+"""
+Массовый импорт и экспорт парка автомобилей (manage.py import_cars,
+export_cars) в CSV или JSONL.
+
+Файл читается и пишется потоково, генераторами, и обрабатывается
+пачками по batch_size строк, поэтому память не зависит от размера
+файла. Строка сопоставляется с машиной по external_id: существующие
+машины обновляются bulk_update (только если что-то изменилось), новые
+вставляются bulk_create с update_conflicts по external_id (строку мог
+успеть вставить параллельный импорт). Категории ищутся по названию в
+словаре, недостающие создаются один раз. Слаги новых машин раздаёт
+SlugAllocator: занятые номера для всех базовых слагов пачки читаются
+одним запросом.
+
+bulk-операции не вызывают сигналы Car, поэтому поисковый индекс (только
+для машин с изменёнными полями поиска) и кеши каталога обновляются
+после импорта (refresh_caches()).
+"""
+import csv
+import json
+from functools import lru_cache
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from . import catalogue, page_cache, pricing, search, suggest
+from .models import Car, CarCategory
+
+FORMATS = ('csv', 'jsonl')
+
+# Колонки файла: external_id, затем поля Car; category - название категории
+COLUMNS = (
+    'external_id', 'name', 'brand', 'model', 'year', 'category',
+    'price_per_day', 'price_per_hour', 'available', 'description',
+    'fuel_type', 'transmission', 'seats', 'doors', 'engine_volume', 'power',
+    'air_conditioning', 'gps', 'bluetooth', 'parking_sensors', 'reverse_camera',
+)
+REQUIRED = ('external_id', 'name', 'brand', 'model', 'year', 'price_per_day')
+EXPORT_COLUMNS = COLUMNS + ('slug',)
+
+# Строк в одном UPDATE из bulk_update: CASE WHEN на каждую колонку растёт с пачкой
+UPDATE_BATCH_SIZE = 100
+
+# Пустое значение в колонке с умолчанием: новая машина получает умолчание, старая не меняется
+DEFAULT = object()
+
+
+class RowError(Exception):
+    def __init__(self, line, message):
+        super().__init__(f'строка {line}: {message}')
+        self.line = line
+
+
+def read_rows(stream, fmt):
+    """Словари строк файла; пустые значения CSV приходят как ''."""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_rows(rows, stream, fmt):
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(EXPORT_COLUMNS)
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            stream.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False, default=str))
+            stream.write('\n')
+
+
+def export_rows(queryset, chunk_size=2000):
+    """Кортежи значений в порядке EXPORT_COLUMNS, без загрузки моделей (None в CSV - пустая строка)."""
+    fields = ['category__name' if name == 'category' else name for name in EXPORT_COLUMNS]
+    return queryset.order_by('pk').values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class CategoryCache:
+    def __init__(self):
+        self.ids = dict(CarCategory.objects.values_list('name', 'id'))
+
+    def get_id(self, name):
+        name = str(name or '').strip()
+        if not name:
+            return None
+        if name not in self.ids:
+            self.ids[name] = CarCategory.objects.get_or_create(name=name)[0].pk
+        return self.ids[name]
+
+
+class SlugAllocator:
+    """Уникальные слаги base, base-2, base-3... для пачки новых машин."""
+
+    def __init__(self):
+        self.counters = {}
+
+    def prefetch(self, bases):
+        missing = {base for base in bases if base not in self.counters}
+        if missing:
+            self.counters.update(Car.objects.slug_counters(missing))
+
+    def allocate(self, base):
+        self.counters[base] += 1
+        number = self.counters[base]
+        return base if number == 1 else f'{base}-{number}'
+
+
+@lru_cache(maxsize=16384)
+def clean_value(name, raw):
+    """
+    Значение поля Car из файла, с проверками модели. Марки, годы, цены
+    и флаги в файле повторяются, поэтому результат кешируется.
+    """
+    field = Car._meta.get_field(name)
+    if isinstance(raw, str):
+        raw = raw.strip()
+    if raw in ('', None):
+        if name in REQUIRED:
+            raise ValidationError(f'не заполнено поле {name}')
+        if field.null:
+            return None
+        if field.has_default():
+            return DEFAULT
+        raw = ''
+    try:
+        return field.clean(raw, None)
+    except ValidationError as exc:
+        raise ValidationError(f'{name}: {"; ".join(exc.messages)}')
+
+
+def parse_row(row, line, categories):
+    """{поле Car: значение} для колонок, которые есть в строке."""
+    values = {}
+    for name in COLUMNS:
+        if name not in row:
+            continue
+        try:
+            if name == 'category':
+                values['category_id'] = categories.get_id(row[name])
+            else:
+                value = clean_value(name, row[name])
+                if value is not DEFAULT:
+                    values[name] = value
+        except ValidationError as exc:
+            raise RowError(line, exc.messages[0])
+        except TypeError:
+            raise RowError(line, f'{name}: недопустимое значение')
+    missing = [name for name in REQUIRED if name not in values]
+    if missing:
+        raise RowError(line, f'нет колонок {", ".join(missing)}')
+    return values
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = 0
+        # Новые машины и машины, у которых изменились поля поиска
+        self.indexed_ids = []
+
+    @property
+    def changed(self):
+        return self.created + self.updated
+
+
+def import_rows(rows, batch_size=1000, on_error=None, first_line=1):
+    """
+    Импортирует строки пачками; вызывать внутри transaction.atomic().
+    Ошибочная строка передаётся в on_error(RowError) и пропускается;
+    без on_error исключение прерывает импорт. first_line - номер первой
+    строки данных в файле (для сообщений об ошибках).
+    """
+    result = ImportResult()
+    categories = CategoryCache()
+    slugs = SlugAllocator()
+    numbered = enumerate(rows, start=first_line)
+    for batch in batched(numbered, batch_size):
+        parsed = {}
+        for line, row in batch:
+            try:
+                values = parse_row(row, line, categories)
+            except RowError as exc:
+                if on_error is None:
+                    raise
+                on_error(exc)
+                result.errors += 1
+                continue
+            # Повтор ключа в файле: побеждает последняя строка
+            parsed[values['external_id']] = values
+        _import_batch(parsed, slugs, result, batch_size)
+    return result
+
+
+def _import_batch(parsed, slugs, result, batch_size):
+    now = timezone.now()
+    fields = sorted({name for values in parsed.values() for name in values} - {'external_id'})
+    existing = Car.objects.filter(external_id__in=list(parsed)).values_list('external_id', 'pk', *fields)
+
+    changed = []
+    changed_fields = set()
+    for external_id, pk, *current in existing.iterator():
+        values = parsed.pop(external_id)
+        current = dict(zip(fields, current))
+        diff = {name for name, value in values.items() if name != 'external_id' and current[name] != value}
+        if not diff:
+            result.unchanged += 1
+            continue
+        changed.append(Car(pk=pk, **{**current, **values}, updated_at=now))
+        changed_fields |= diff
+        if not search.INDEXED_FIELDS.isdisjoint(diff):
+            result.indexed_ids.append(pk)
+    if changed:
+        # Только колонки, которые изменились хоть в одной строке пачки: CASE WHEN строится на каждую
+        Car.objects.bulk_update(
+            changed, [*sorted(changed_fields), 'updated_at'], batch_size=min(batch_size, UPDATE_BATCH_SIZE),
+        )
+        result.updated += len(changed)
+
+    ids = [car.pk for car in changed]
+    if parsed:
+        created = _insert_cars(list(parsed.values()), slugs, fields, batch_size)
+        result.created += len(created)
+        # update_conflicts мог обновить машину, которую вставил параллельный импорт
+        ids += [car.pk for car in created]
+        result.indexed_ids += [car.pk for car in created]
+    if ids:
+        transaction.on_commit(lambda: _purge_cars(ids))
+
+
+def _insert_cars(rows, slugs, fields, batch_size):
+    """
+    Новые машины. Если строку с тем же external_id уже вставил
+    параллельный импорт, она обновляется значениями из файла.
+    """
+    bases = [Car.slug_base(row['brand'], row['model'], row['year']) for row in rows]
+    slugs.prefetch(bases)
+    cars = [Car(**row, slug=slugs.allocate(base)) for row, base in zip(rows, bases)]
+    return Car.objects.bulk_create(
+        cars, batch_size=batch_size,
+        update_conflicts=True, unique_fields=['external_id'], update_fields=[*fields, 'updated_at'],
+    )
+
+
+def _purge_cars(ids):
+    page_cache.purge(*(page_cache.car_tag(pk) for pk in ids))
+    pricing.invalidate_rates(*ids)
+
+
+def refresh_caches(car_ids=None):
+    """
+    То, что для одной машины делают сигналы Car: индекс поиска и кеши
+    каталога. car_ids - машины для переиндексации; None - весь индекс.
+    """
+    if car_ids is None:
+        search.get_backend().rebuild()
+    elif car_ids:
+        search.get_backend().index_many(car_ids)
+
+    def purge():
+        suggest.invalidate()
+        catalogue.invalidate()
+        page_cache.purge(page_cache.CATALOGUE)
+
+    transaction.on_commit(purge)
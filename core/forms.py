@@ -2,6 +2,8 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from .models import Order, Review, UserProfile
+from . import occupancy, pricing
+from .search import get_backend as get_search_backend
 
 
 class BookingForm(forms.ModelForm):
@@ -71,25 +73,36 @@ class BookingForm(forms.ModelForm):
     child_seat = forms.BooleanField(
         required=False,
         widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
-        label='Детское кресло (+500 сом/день)'
+        label=pricing.extra_label('child_seat')
     )
     
     additional_driver = forms.BooleanField(
         required=False,
         widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
-        label='Дополнительный водитель (+300 сом/день)'
+        label=pricing.extra_label('additional_driver')
     )
     
     insurance = forms.BooleanField(
         required=False,
         widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
-        label='Расширенная страховка (+800 сом/день)'
+        label=pricing.extra_label('insurance')
     )
     
     class Meta:
         model = Order
         fields = ['start_date', 'end_date', 'pickup_location', 'return_location', 
                  'phone', 'email', 'notes', 'child_seat', 'additional_driver', 'insurance']
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+        if start_date and end_date:
+            try:
+                pricing.check_period(start_date, end_date)
+            except ValueError as exc:
+                self.add_error('end_date', str(exc))
+        return cleaned_data
 
 
 class ReviewForm(forms.ModelForm):
@@ -196,7 +209,9 @@ class CarSearchForm(forms.Form):
         required=False,
         widget=forms.TextInput(attrs={
             'class': 'form-control',
-            'placeholder': 'Марка автомобиля'
+            'placeholder': 'Марка автомобиля',
+            'list': 'brand-suggestions',
+            'autocomplete': 'off'
         }),
         label='Марка'
     )
@@ -254,4 +269,74 @@ class CarSearchForm(forms.Form):
         }),
         label='Мест не менее'
     )
+    
+    start_date = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={
+            'class': 'form-control',
+            'type': 'date'
+        }),
+        label='Свободен с'
+    )
+    
+    end_date = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={
+            'class': 'form-control',
+            'type': 'date'
+        }),
+        label='Свободен по'
+    )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+        if start_date and end_date and end_date < start_date:
+            self.add_error('end_date', 'Дата окончания должна быть не раньше даты начала.')
+        return cleaned_data
+    
+    @property
+    def rental_days(self):
+        """(первый, последний) день из фильтра дат или None; одна дата - один день."""
+        start_date = self.cleaned_data.get('start_date')
+        end_date = self.cleaned_data.get('end_date')
+        if not (start_date or end_date):
+            return None
+        return start_date or end_date, end_date or start_date
+    
+    def filter_cars(self, cars):
+        """
+        Применяет фильтры к выборке автомобилей (форма должна быть валидна).
+        Бэкенд поиска, если был поиск, сохраняется в self.search_backend.
+        """
+        data = self.cleaned_data
+        self.search_backend = None
+        
+        if data.get('search'):
+            self.search_backend = get_search_backend()
+            cars = self.search_backend.search(cars, data['search'])
+        
+        if data.get('brand'):
+            cars = cars.filter(brand__icontains=data['brand'])
+        
+        if data.get('min_price'):
+            cars = cars.filter(price_per_day__gte=data['min_price'])
+        
+        if data.get('max_price'):
+            cars = cars.filter(price_per_day__lte=data['max_price'])
+        
+        if data.get('fuel_type'):
+            cars = cars.filter(fuel_type=data['fuel_type'])
+        
+        if data.get('transmission'):
+            cars = cars.filter(transmission=data['transmission'])
+        
+        if data.get('seats'):
+            cars = cars.filter(seats__gte=data['seats'])
+        
+        if self.rental_days:
+            cars = cars.exclude(pk__in=occupancy.busy_car_ids(*self.rental_days))
+        
+        return cars
 
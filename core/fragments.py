@@ -0,0 +1,98 @@
+"""
+Кеш HTML-фрагментов карточек автомобилей.
+
+Ключ включает pk, updated_at и счётчики отзывов (они меняются через
+UPDATE в обход save(), см. core.ratings), поэтому изменённая машина
+сразу получает новый ключ. Старые фрагменты удаляются сигналами Car
+(core.signals). Кеш и время жизни задаются CAR_CARD_CACHE и
+CAR_CARD_CACHE_TIMEOUT; CAR_CARD_CACHE = None отключает кеширование.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import images, metrics
+
+# Заглушки для автомобилей без фото, по марке
+PLACEHOLDER_PHOTOS = {
+    'BMW': 'photo-1555215695-3004980ad54e',
+    'Toyota': 'photo-1621007947382-bb3c3994e3fb',
+    'Hyundai': 'photo-1503376780353-7e6692767b70',
+    'Mercedes-Benz': 'photo-1563720223185-11003d516935',
+    'Audi': 'photo-1606664515524-ed2f786a0bd6',
+    'Volkswagen': 'photo-1552519507-da3b142c6e3d',
+}
+DEFAULT_PLACEHOLDER_PHOTO = 'photo-1549317661-bd32c8ce0db2'
+
+IMAGE_VARIANTS = {
+    'card': {'img_class': 'card-img-top', 'img_style': '', 'width': 400},
+    'thumb': {'img_class': 'img-fluid rounded shadow', 'img_style': 'height: 120px; object-fit: cover;', 'width': 300},
+    'detail': {'img_class': 'card-img-top', 'img_style': 'height: 400px; object-fit: cover;', 'width': 800},
+}
+
+FRAGMENTS = {
+    # Вариант картинки - "<вид>:<ширина>", ширина из IMAGE_WIDTHS
+    'image': ('core/includes/car_image.html', lambda: tuple(
+        f'{variant}:{width}' for variant in IMAGE_VARIANTS for width in settings.IMAGE_WIDTHS
+    )),
+    'body': ('core/includes/car_card_body.html', lambda: ('grid', 'featured')),
+}
+
+
+def placeholder_url(brand, width):
+    photo = PLACEHOLDER_PHOTOS.get(brand, DEFAULT_PLACEHOLDER_PHOTO)
+    return f'https://images.unsplash.com/{photo}?ixlib=rb-4.0.3&auto=format&fit=crop&w={width}&q=80'
+
+
+def fragment_key(kind, variant, car):
+    return (
+        f'car_fragment:{kind}:{variant}:{car.pk}:'
+        f'{car.updated_at.timestamp() if car.updated_at else 0}:{car.rating_sum}:{car.reviews_count}'
+    )
+
+
+def render_fragment(kind, variant, car, get_context):
+    """get_context вызывается только при промахе кеша."""
+    template_name = FRAGMENTS[kind][0]
+    if not settings.CAR_CARD_CACHE:
+        return mark_safe(render_to_string(template_name, get_context()))
+    cache = caches[settings.CAR_CARD_CACHE]
+    key = fragment_key(kind, variant, car)
+    html = cache.get(key)
+    metrics.cache_lookup('fragment', html is not None)
+    if html is None:
+        html = render_to_string(template_name, get_context())
+        cache.set(key, html, settings.CAR_CARD_CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+def render_image(car, variant='card', width=None):
+    options = IMAGE_VARIANTS[variant]
+    width = images.snap_width(width or options['width'])
+
+    def get_context():
+        if car.image:
+            src, picture_sources = car.image.url, images.sources(car.image.name, width)
+        else:
+            src, picture_sources = placeholder_url(car.brand, width), []
+        return {
+            'car': car, 'src': src, 'sources': picture_sources, 'width': width,
+            'img_class': options['img_class'], 'img_style': options['img_style'],
+        }
+
+    return render_fragment('image', f'{variant}:{width}', car, get_context)
+
+
+def render_body(car, variant='grid'):
+    return render_fragment('body', variant, car, lambda: {'car': car, 'variant': variant})
+
+
+def invalidate(car):
+    if not settings.CAR_CARD_CACHE:
+        return
+    caches[settings.CAR_CARD_CACHE].delete_many([
+        fragment_key(kind, variant, car)
+        for kind, (_, variants) in FRAGMENTS.items()
+        for variant in variants()
+    ])
@@ -0,0 +1,225 @@
+"""
+Уменьшенные копии фото автомобилей и аватаров.
+
+Оригинал уменьшается до ширин IMAGE_WIDTHS (без увеличения) в форматах
+IMAGE_FORMATS, которые поддерживает установленный Pillow. Файлы лежат
+в IMAGE_DERIVATIVES_ROOT по хешу содержимого оригинала:
+<sha256[:2]>/<sha256>/<ширина>.<формат> (первые два символа - чтобы в
+одном каталоге не копились тысячи папок), поэтому одинаковые фото
+хранятся один раз, а заменённое фото получает новый адрес. Какой файл
+какому хешу соответствует, хранит модель ImageDerivative (и кеш).
+Отсутствие превью кешируется ненадолго (IMAGE_DERIVATIVE_MISS_TIMEOUT):
+запись о готовом превью видит только кеш процесса, который его
+сгенерировал, если кеш не общий.
+
+Генерация идёт в пуле потоков после коммита транзакции (schedule()
+из сигналов Car и UserProfile), а не в запросе. Уже загруженные файлы
+обрабатывает manage.py backfill_images.
+"""
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connections, transaction
+from django.utils.functional import LazyObject
+from PIL import Image, ImageOps, features
+
+from .models import ImageDerivative
+
+logger = logging.getLogger(__name__)
+
+# Поля с загружаемыми изображениями по моделям
+IMAGE_FIELDS = {
+    'core.Car': ('image', 'image2', 'image3'),
+    'core.UserProfile': ('avatar',),
+}
+
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'avif': {'format': 'AVIF', 'quality': 60},
+}
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+
+class DerivativeStorage(LazyObject):
+    def _setup(self):
+        self._wrapped = FileSystemStorage(
+            location=settings.IMAGE_DERIVATIVES_ROOT,
+            base_url=settings.IMAGE_DERIVATIVES_URL,
+        )
+
+
+storage = DerivativeStorage()
+
+
+def available_formats():
+    return [fmt for fmt in settings.IMAGE_FORMATS if features.check(fmt)]
+
+
+def snap_width(width):
+    """Ближайшая ширина из IMAGE_WIDTHS не меньше запрошенной."""
+    widths = sorted(settings.IMAGE_WIDTHS)
+    return next((w for w in widths if w >= width), widths[-1])
+
+
+def derivative_path(digest, width, fmt):
+    return f'{digest[:2]}/{digest}/{width}.{fmt}'
+
+
+def _cache_key(source):
+    return f'images:derivative:{hashlib.sha1(source.encode()).hexdigest()}'
+
+
+def get_derivative(source):
+    """{'digest', 'widths', 'formats'} для файла или None, если превью ещё нет."""
+    key = _cache_key(source)
+    entry = cache.get(key)
+    if entry is None:
+        row = ImageDerivative.objects.filter(source=source).values('digest', 'widths', 'formats').first()
+        entry = row or {}
+        # Промах кешируем ненадолго: превью мог сделать другой процесс
+        cache.set(key, entry, None if row else settings.IMAGE_DERIVATIVE_MISS_TIMEOUT)
+    return entry or None
+
+
+def forget(source_names):
+    """Сбрасывает закешированные записи о превью, например после их удаления."""
+    cache.delete_many([_cache_key(source) for source in source_names])
+
+
+def sources(source, width):
+    """<source> для <picture>: [{'type', 'srcset'}], самый сжатый формат первым."""
+    derivative = get_derivative(source) if source else None
+    if not derivative:
+        return []
+    # Для экранов с высокой плотностью пикселей нужны ширины до 2x
+    widths = [w for w in derivative['widths'] if w <= width * 2] or derivative['widths'][:1]
+    return [
+        {
+            'type': MIME_TYPES[fmt],
+            'srcset': ', '.join(
+                f"{storage.url(derivative_path(derivative['digest'], w, fmt))} {w}w" for w in widths
+            ),
+        }
+        for fmt in settings.IMAGE_FORMATS
+        if fmt in derivative['formats']
+    ]
+
+
+def file_digest(field_file):
+    digest = hashlib.sha256()
+    with field_file.open('rb') as f:
+        for chunk in f.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _prepare(field_file):
+    with field_file.open('rb') as f:
+        with Image.open(f) as image:
+            image = ImageOps.exif_transpose(image)
+            return image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+
+def generate(field_file):
+    """Создаёт превью для файла, если их ещё нет. Возвращает (ImageDerivative, created)."""
+    existing = ImageDerivative.objects.filter(source=field_file.name).first()
+    if existing is not None:
+        return existing, False
+
+    digest = file_digest(field_file)
+    image = _prepare(field_file)
+    widths = [w for w in sorted(settings.IMAGE_WIDTHS) if w <= image.width] or [image.width]
+    formats = available_formats()
+    for width in widths:
+        resized = image if width == image.width else image.resize(
+            (width, max(1, round(image.height * width / image.width))), Image.LANCZOS
+        )
+        for fmt in formats:
+            path = derivative_path(digest, width, fmt)
+            # Тот же хеш - те же файлы, например после повторной загрузки фото
+            if storage.exists(path):
+                continue
+            buffer = io.BytesIO()
+            resized.save(buffer, **SAVE_OPTIONS[fmt])
+            storage.save(path, ContentFile(buffer.getvalue()))
+
+    derivative, _ = ImageDerivative.objects.update_or_create(
+        source=field_file.name,
+        defaults={'digest': digest, 'widths': widths, 'formats': formats},
+    )
+    cache.set(_cache_key(field_file.name), {
+        'digest': digest, 'widths': widths, 'formats': formats,
+    }, None)
+    return derivative, True
+
+
+def process(model_label, pk, field_names):
+    """Превью для полей одного объекта; после появления сбрасывает кеш карточек."""
+    from . import fragments, page_cache
+
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    created = False
+    for name in field_names:
+        field_file = getattr(instance, name)
+        if field_file:
+            created |= generate(field_file)[1]
+    if created and model_label == 'core.Car':
+        fragments.invalidate(instance)
+        page_cache.purge(page_cache.CATALOGUE, page_cache.car_tag(pk))
+
+
+def _run(model_label, pk, field_names):
+    try:
+        process(model_label, pk, field_names)
+    except Exception:
+        logger.exception('Не удалось создать превью для %s #%s', model_label, pk)
+
+
+def _run_in_worker(model_label, pk, field_names):
+    try:
+        _run(model_label, pk, field_names)
+    finally:
+        # У потока пула свои соединения с БД, закрываем их после задачи
+        connections.close_all()
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix='images')
+    return _executor
+
+
+def schedule(instance, update_fields=None):
+    """Ставит генерацию превью в пул после коммита текущей транзакции."""
+    label = instance._meta.label
+    deferred = instance.get_deferred_fields()
+    field_names = [
+        name for name in IMAGE_FIELDS[label]
+        if name not in deferred and (update_fields is None or name in update_fields)
+        and getattr(instance, name)
+    ]
+    if not field_names:
+        return
+
+    def submit():
+        if settings.IMAGE_WORKERS:
+            _get_executor().submit(_run_in_worker, label, instance.pk, field_names)
+        else:
+            _run(label, instance.pk, field_names)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,151 @@
+"""
+Очередь фоновых задач в базе данных.
+
+Задача - строка Job с именем обработчика и JSON-аргументами. enqueue()
+пишет её в той же транзакции, что и бизнес-данные, поэтому задача
+появляется ровно тогда, когда закоммичен заказ. Воркеры
+(manage.py run_workers) забирают задачи через SELECT ... FOR UPDATE
+SKIP LOCKED, где СУБД это умеет; на SQLite записи сериализует
+транзакция IMMEDIATE. Упавшая задача повторяется с экспоненциальной
+задержкой до max_attempts, задача зависшего воркера возвращается в
+работу через JOB_LOCK_TIMEOUT. Ключ идемпотентности не даёт поставить
+одну и ту же задачу дважды.
+
+Обработчики регистрируются декоратором @task (см. core.tasks) и должны
+быть идемпотентны: при сбое воркера задача может выполниться повторно.
+
+Выполненные задачи хранятся JOB_RETENTION_DAYS, упавшие -
+JOB_FAILED_RETENTION_DAYS; удаляет их purge_finished(), который
+вызывает run_workers раз в JOB_PURGE_INTERVAL секунд и при --once.
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def task(name):
+    def decorator(func):
+        HANDLERS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, key=None, delay=0, max_attempts=None):
+    """Ставит задачу в очередь; с уже использованным key возвращает существующую."""
+    if name not in HANDLERS:
+        raise KeyError(f'Неизвестная задача: {name}')
+    job = Job(
+        name=name,
+        payload=payload or {},
+        idempotency_key=key,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+    if key is not None:
+        try:
+            with transaction.atomic():
+                job.save()
+        except IntegrityError:
+            return Job.objects.get(idempotency_key=key)
+    else:
+        job.save()
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: run_eager(job.pk))
+    return job
+
+
+def retry_delay(attempts):
+    """Задержка перед повтором: удваивается с каждой попыткой, с разбросом ±25%."""
+    delay = settings.JOB_RETRY_DELAY * 2 ** (attempts - 1)
+    return delay * random.uniform(0.75, 1.25)
+
+
+def claim(worker, limit=1, pk=None):
+    """Забирает до limit готовых задач и помечает их как выполняемые воркером worker."""
+    now = timezone.now()
+    ready = Q(status='pending', run_at__lte=now) | Q(
+        status='running', locked_at__lt=now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    )
+    if pk is not None:
+        ready &= Q(pk=pk)
+    with transaction.atomic():
+        candidates = Job.objects.filter(ready).order_by('run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        # Условие ready повторяется: без SKIP LOCKED задачу мог забрать другой воркер
+        Job.objects.filter(ready, pk__in=ids).update(
+            status='running', locked_at=now, locked_by=worker, attempts=F('attempts') + 1,
+        )
+        return list(Job.objects.filter(pk__in=ids, status='running', locked_by=worker, locked_at=now))
+
+
+def _finish(job, **fields):
+    # Если воркер завис дольше JOB_LOCK_TIMEOUT и задачу забрал другой, его результат не пишем
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by, locked_at=job.locked_at).update(**fields)
+
+
+def execute(job):
+    handler = HANDLERS.get(job.name)
+    try:
+        if handler is None:
+            raise KeyError(f'Неизвестная задача: {job.name}')
+        handler(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Задача %s #%s не выполнена после %s попыток', job.name, job.pk, job.attempts)
+            _finish(
+                job, status='failed', last_error=error, finished_at=timezone.now(), locked_by='',
+            )
+        else:
+            logger.warning('Задача %s #%s упала, попытка %s', job.name, job.pk, job.attempts)
+            _finish(
+                job, status='pending', last_error=error, locked_at=None, locked_by='',
+                run_at=timezone.now() + timedelta(seconds=retry_delay(job.attempts)),
+            )
+        return False
+    _finish(job, status='done', finished_at=timezone.now(), locked_by='')
+    return True
+
+
+def run_eager(job_pk):
+    for job in claim(f'eager-{job_pk}', pk=job_pk):
+        execute(job)
+
+
+def purge_finished(batch_size=1000):
+    """Удаляет старые выполненные и упавшие задачи пачками; возвращает число удалённых."""
+    now = timezone.now()
+    expired = Job.objects.filter(
+        Q(status='done', finished_at__lt=now - timedelta(days=settings.JOB_RETENTION_DAYS))
+        | Q(status='failed', finished_at__lt=now - timedelta(days=settings.JOB_FAILED_RETENTION_DAYS))
+    )
+    deleted = 0
+    while True:
+        ids = list(expired.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Job.objects.filter(pk__in=ids).delete()[0]
+
+
+def work_once(worker, limit=5):
+    """Выполняет одну пачку задач; возвращает число выполненных (в т.ч. неудачно)."""
+    jobs = claim(worker, limit)
+    for job in jobs:
+        execute(job)
+    return len(jobs)
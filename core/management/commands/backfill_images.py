@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+
+from core import images
+from core.models import ImageDerivative
+
+
+class Command(BaseCommand):
+    help = 'Создаёт превью для уже загруженных фото автомобилей и аватаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Сколько файлов обрабатывать параллельно')
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать записи о превью (файлы с тем же хешем не перезаписываются)')
+
+    def handle(self, *args, **options):
+        jobs = []
+        for label, field_names in images.IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            has_image = Q()
+            for name in field_names:
+                has_image |= ~Q(**{name: ''}) & Q(**{f'{name}__isnull': False})
+            for pk in model.objects.filter(has_image).values_list('pk', flat=True).iterator():
+                jobs.append((label, pk, field_names))
+
+        if options['force']:
+            sources = list(ImageDerivative.objects.values_list('source', flat=True))
+            ImageDerivative.objects.all().delete()
+            images.forget(sources)
+
+        done = ImageDerivative.objects.count()
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            list(pool.map(lambda job: self.run(*job), jobs))
+        created = ImageDerivative.objects.count() - done
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Объектов с фото: {len(jobs)}, новых превью: {created}, всего: {done + created}'
+        ))
+
+    def run(self, label, pk, field_names):
+        try:
+            images.process(label, pk, field_names)
+        except Exception as exc:
+            self.stderr.write(f'{label} #{pk}: {exc}')
+        finally:
+            connections.close_all()
@@ -0,0 +1,61 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.benchmarks import measure, summary
+from core.models import Car, Order
+
+
+class Command(BaseCommand):
+    help = 'Замер проверки пересечения заказов на синтетических данных (всё откатывается)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--cars', type=int, default=2_000)
+        parser.add_argument('--lookups', type=int, default=1_000)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options)
+            self.run_lookups(options)
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        user = User.objects.create(username='bench-availability')
+        cars = Car.objects.bulk_create(
+            Car(name=f'Bench {i}', brand='Bench', model=str(i), year=2020,
+                price_per_day=1000, slug=f'bench-availability-{i}')
+            for i in range(options['cars'])
+        )
+        self.car_ids = [car.pk for car in cars]
+        self.origin = timezone.now()
+        statuses = [status for status, _ in Order.STATUS_CHOICES]
+
+        batch = []
+        for _ in range(options['orders']):
+            start = self.origin + timedelta(hours=random.randrange(0, 24 * 365 * 3))
+            batch.append(Order(
+                user=user, car_id=random.choice(self.car_ids),
+                start_date=start, end_date=start + timedelta(days=random.randint(1, 14)),
+                pickup_location='-', return_location='-', total_price=0,
+                status=random.choice(statuses), phone='-', email='bench@example.com',
+            ))
+            if len(batch) >= options['batch_size']:
+                Order.objects.bulk_create(batch)
+                batch = []
+        Order.objects.bulk_create(batch)
+        self.stdout.write(f"Создано заказов: {options['orders']}, автомобилей: {options['cars']}")
+
+    def run_lookups(self, options):
+        def lookup():
+            start = self.origin + timedelta(hours=random.randrange(0, 24 * 365 * 3))
+            end = start + timedelta(days=random.randint(1, 7))
+            Order.objects.overlapping(start, end, car=random.choice(self.car_ids)).exists()
+
+        timings = measure(lookup, options['lookups'])
+        self.stdout.write(f'overlap lookup, мс: {summary(timings)}')
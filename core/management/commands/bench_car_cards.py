@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import Context, Template
+from django.test.utils import override_settings
+
+from core import fragments
+from core.benchmarks import measure, summary
+from core.models import Car
+
+GRID = Template(
+    '{% load car_tags %}'
+    '{% for car in cars %}{% car_image car %}{% car_card_body car %}{% endfor %}'
+)
+
+
+class Command(BaseCommand):
+    help = 'Время рендера сетки карточек без кеша фрагментов и с ним (данные откатываются)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=12)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            Car.objects.bulk_create(
+                Car(name=f'Bench {i}', brand='BMW', model=f'M{i}', year=2020, price_per_day=1000,
+                    description='Комфортный автомобиль для города и дальних поездок ' * 3,
+                    slug=f'bench-cards-{i}')
+                for i in range(options['cards'])
+            )
+            cars = list(Car.objects.filter(slug__startswith='bench-cards-'))
+            transaction.set_rollback(True)
+
+        context = Context({'cars': cars})
+        with override_settings(CAR_CARD_CACHE=None):
+            uncached = measure(lambda: GRID.render(context), options['repeat'])
+        GRID.render(context)  # прогрев
+        cached = measure(lambda: GRID.render(context), options['repeat'])
+        for car in cars:
+            fragments.invalidate(car)
+
+        self.stdout.write(f"{options['cards']} карточек без кеша, мс: {summary(uncached)}")
+        self.stdout.write(f"{options['cards']} карточек из кеша, мс: {summary(cached)}")
@@ -0,0 +1,66 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from core.benchmarks import measure, summary
+from core.models import Car
+from core.search import get_backend
+
+BRANDS = {
+    'Toyota': ['Camry', 'Corolla', 'RAV4', 'Land Cruiser'],
+    'BMW': ['X5', 'X3', '320i', '530d'],
+    'Mercedes-Benz': ['E200', 'C180', 'GLE', 'S500'],
+    'Hyundai': ['Solaris', 'Elantra', 'Tucson', 'Sonata'],
+    'Audi': ['A4', 'A6', 'Q5', 'Q7'],
+    'Volkswagen': ['Polo', 'Passat', 'Tiguan', 'Golf'],
+}
+WORDS = ['комфортный', 'надежный', 'экономичный', 'просторный', 'семейный', 'спортивный',
+         'городской', 'кожаный', 'салон', 'климат', 'полный', 'привод', 'камера', 'навигация']
+QUERIES = ['bmw', 'toy', 'camry', 'mercedes e200', 'просторный салон', 'привод', 'audi q']
+
+
+class Command(BaseCommand):
+    help = 'Сравнение icontains-поиска и полнотекстового индекса на синтетическом каталоге (всё откатывается)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cars', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['cars'])
+            self.compare(options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        cars = []
+        for i in range(count):
+            brand = random.choice(list(BRANDS))
+            model = random.choice(BRANDS[brand])
+            cars.append(Car(
+                name=f'{brand} {model}', brand=brand, model=model, year=random.randint(2005, 2025),
+                price_per_day=random.randint(1000, 20000), slug=f'bench-search-{i}',
+                description=' '.join(random.sample(WORDS, 6)),
+            ))
+        Car.objects.bulk_create(cars, batch_size=5000)
+        get_backend().rebuild()
+        self.stdout.write(f'Создано автомобилей: {count}')
+
+    def compare(self, repeat):
+        backend = get_backend()
+        base = Car.objects.filter(available=True)
+        for query in QUERIES:
+            def like():
+                list(base.filter(
+                    Q(name__icontains=query) | Q(brand__icontains=query) |
+                    Q(model__icontains=query) | Q(description__icontains=query)
+                ).order_by('-created_at')[:12])
+
+            def indexed():
+                list(backend.search(base, query).order_by('-search_rank', '-created_at')[:12])
+
+            self.stdout.write(f'"{query}"')
+            self.stdout.write(f'  icontains, мс: {summary(measure(like, repeat))}')
+            self.stdout.write(f'  {type(backend).__name__}, мс: {summary(measure(indexed, repeat))}')
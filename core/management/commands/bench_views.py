@@ -0,0 +1,163 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from core.benchmarks import load_baseline, measure_requests, regressions, request_stats, save_baseline
+from core.catalogue import ORDERINGS
+from core.models import Car
+
+# Фильтры главной; каждый прогоняется со всеми сортировками из ORDERINGS
+HOME_FILTERS = {
+    'all': {},
+    'brand': {'brand': 'Toyota'},
+    'price': {'min_price': 2000, 'max_price': 5000},
+    'fuel_transmission': {'fuel_type': 'petrol', 'transmission': 'automatic'},
+    'seats': {'seats': 7},
+    'dates': {'start_date': 7, 'end_date': 10},  # дни от сегодня
+    'search': {'search': 'camry'},
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер p50/p95/p99 и числа SQL для главной (все сортировки и фильтры; без входа - через кеш '
+        'страниц), страницы машины, '
+        'бронирования, моих заказов и избранного на данных seed_bench; сравнение с базовой линией '
+        '(созданные заказы и избранное откатываются)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='bench-user-0',
+                            help='От чьего имени запросы (у bench-user-0 больше всего заказов)')
+        parser.add_argument('--requests', type=int, default=30, help='Запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=3, help='Запросов на прогрев, не учитываются')
+        parser.add_argument('--only', action='append', default=[], help='Только сценарии с этим префиксом')
+        parser.add_argument('--baseline', default='bench_baseline.json')
+        parser.add_argument('--save-baseline', action='store_true', help='Записать результат как базовую линию')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Допустимый рост p95 (доля)')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"Нет пользователя {options['user']}; сначала manage.py seed_bench")
+        cars = list(Car.objects.filter(available=True).order_by('?').values_list('pk', 'slug')[:200])
+        if not cars:
+            raise CommandError('Нет доступных автомобилей; сначала manage.py seed_bench')
+
+        setup_test_environment()
+        self.rng = random.Random(1)
+        results = {}
+        try:
+            with transaction.atomic(), override_settings(ALLOWED_HOSTS=['*']):
+                client = Client()
+                client.force_login(user)
+                for name, send in self.scenarios(client, cars).items():
+                    if options['only'] and not name.startswith(tuple(options['only'])):
+                        continue
+                    for _ in range(options['warmup']):
+                        send()
+                    results[name] = request_stats(*measure_requests(send, options['requests']))
+                    self.report(name, results[name])
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.compare(results, options)
+
+    def scenarios(self, client, cars):
+        # Анонимный посетитель: главная отдаётся из кеша страниц (PAGE_CACHE)
+        anonymous = Client()
+
+        def get(url, client=client, **params):
+            def send():
+                response = client.get(url, params)
+                if response.status_code != 200:
+                    raise CommandError(f'{url}: статус {response.status_code}')
+            return send
+
+        today = timezone.localdate()
+        home = reverse('core:home')
+        filters = {
+            filter_name: (
+                {key: today + timedelta(days=days) for key, days in params.items()}
+                if filter_name == 'dates' else params
+            )
+            for filter_name, params in HOME_FILTERS.items()
+        }
+        scenarios = {}
+        for sort in ORDERINGS:
+            for filter_name, params in filters.items():
+                scenarios[f'home:{sort}:{filter_name}'] = get(home, sort=sort, **params)
+        for filter_name, params in filters.items():
+            scenarios[f'home:anon:{filter_name}'] = get(home, client=anonymous, **params)
+
+        def car_detail():
+            pk, slug = self.rng.choice(cars)
+            client.get(reverse('core:car_detail', kwargs={'pk': pk, 'slug': slug}))
+
+        def book_form():
+            client.get(reverse('core:book_car', kwargs={'pk': self.rng.choice(cars)[0]}))
+
+        def book():
+            # Даты за пределами данных seed_bench, чтобы бронь в основном проходила
+            start = timezone.now() + timedelta(days=self.rng.randint(400, 800))
+            client.post(reverse('core:book_car', kwargs={'pk': self.rng.choice(cars)[0]}), {
+                'start_date': start.strftime('%Y-%m-%dT%H:00'),
+                'end_date': (start + timedelta(days=self.rng.randint(1, 5))).strftime('%Y-%m-%dT%H:00'),
+                'pickup_location': 'Центр', 'return_location': 'Аэропорт',
+                'phone': '+7 900 000-00-00', 'email': 'bench@example.com',
+            })
+
+        def toggle_favorite():
+            client.post(reverse('core:toggle_favorite', kwargs={'car_pk': self.rng.choice(cars)[0]}))
+
+        scenarios.update({
+            'car_detail': car_detail,
+            'book_car:form': book_form,
+            'book_car:submit': book,
+            'my_orders': get(reverse('core:my_orders')),
+            'toggle_favorite': toggle_favorite,
+        })
+        return scenarios
+
+    def report(self, name, stats):
+        self.stdout.write(
+            f"{name:<36} p50={stats['p50']:8.2f} p95={stats['p95']:8.2f} p99={stats['p99']:8.2f} мс"
+            f"  SQL={stats['queries']:g} (макс. {stats['max_queries']})"
+        )
+
+    def compare(self, results, options):
+        path = options['baseline']
+        if options['save_baseline']:
+            save_baseline(
+                path, results, created_at=timezone.now().isoformat(), vendor=connection.vendor,
+                cars=Car.objects.count(), requests=options['requests'],
+            )
+            self.stdout.write(self.style.SUCCESS(f'Базовая линия записана в {path}'))
+            return
+        try:
+            baseline = load_baseline(path)
+        except FileNotFoundError:
+            self.stdout.write(f'Базовой линии {path} нет; запишите её с --save-baseline')
+            return
+
+        found = regressions(results, baseline, options['tolerance'])
+        if not found:
+            self.stdout.write(self.style.SUCCESS(f'Регрессий относительно {path} нет'))
+            return
+        for name, problems in found.items():
+            self.stdout.write(self.style.ERROR(f"{name}: {'; '.join(problems)}"))
+        if options['fail_on_regression']:
+            raise CommandError(f'Регрессий: {len(found)}')
@@ -0,0 +1,28 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from core import fleet
+from core.models import Car
+
+
+class Command(BaseCommand):
+    help = 'Выгружает автомобили в CSV или JSONL (формат файла import_cars)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Файл или '-' для stdout")
+        parser.add_argument('--format', choices=fleet.FORMATS,
+                            help='По умолчанию определяется по расширению файла')
+        parser.add_argument('--available', action='store_true', help='Только доступные для аренды')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        cars = Car.objects.filter(available=True) if options['available'] else Car.objects.all()
+
+        stream = sys.stdout if path == '-' else open(path, 'w', encoding='utf-8', newline='')
+        try:
+            fleet.write_rows(fleet.export_rows(cars), stream, fmt)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
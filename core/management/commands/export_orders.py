@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import reports
+from core.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Выгружает заказы в CSV (для ночных выгрузок бухгалтерии)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Файл или '-' для stdout")
+        parser.add_argument('--since', help='Заказы, созданные начиная с даты (ГГГГ-ММ-ДД или дата-время)')
+        parser.add_argument('--until', help='Заказы, созданные не позже даты')
+        parser.add_argument('--status', choices=[value for value, _ in Order.STATUS_CHOICES])
+        parser.add_argument('--chunk-size', type=int, default=reports.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            since = reports.parse_moment(options['since']) if options['since'] else None
+            until = reports.parse_moment(options['until'], end_of_day=True) if options['until'] else None
+        except ValueError as exc:
+            raise CommandError(exc)
+        orders = reports.filter_orders(Order.objects.all(), since, until, options['status'])
+        rows = reports.order_rows(orders, chunk_size=max(1, options['chunk_size']))
+
+        if options['path'] == '-':
+            reports.write_csv(rows, sys.stdout)
+            return
+        # utf-8-sig: BOM, чтобы Excel открыл кириллицу
+        with open(options['path'], 'w', encoding='utf-8-sig', newline='') as stream:
+            reports.write_csv(rows, stream)
@@ -0,0 +1,57 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import fleet
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Импортирует автомобили из CSV или JSONL (upsert по external_id)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл или '-' для stdin")
+        parser.add_argument('--format', choices=fleet.FORMATS,
+                            help='По умолчанию определяется по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--skip-errors', action='store_true',
+                            help='Пропускать ошибочные строки вместо отмены всего импорта')
+        parser.add_argument('--dry-run', action='store_true', help='Проверить файл и откатить изменения')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        on_error = (lambda exc: self.stderr.write(str(exc))) if options['skip_errors'] else None
+
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            with transaction.atomic():
+                result = fleet.import_rows(
+                    fleet.read_rows(stream, fmt),
+                    batch_size=max(1, options['batch_size']),
+                    on_error=on_error,
+                    first_line=2 if fmt == 'csv' else 1,
+                )
+                if options['dry_run']:
+                    raise Rollback
+                if result.changed:
+                    fleet.refresh_caches(result.indexed_ids)
+        except Rollback:
+            pass
+        except fleet.RowError as exc:
+            raise CommandError(f'{exc}; импорт отменён')
+        except ValueError as exc:
+            raise CommandError(f'Файл не разобран ({exc}); импорт отменён')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Проверено" if options["dry_run"] else "Импортировано"}: '
+            f'новых {result.created}, обновлено {result.updated}, '
+            f'без изменений {result.unchanged}, ошибок {result.errors}'
+        ))
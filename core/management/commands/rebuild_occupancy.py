@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core import occupancy
+from core.models import CarOccupancy
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает календарь занятости автомобилей по активным заказам'
+
+    def handle(self, *args, **options):
+        occupancy.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Строк занятости: {CarOccupancy.objects.count()}'))
@@ -0,0 +1,42 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from core import catalogue, page_cache
+from core.models import Car
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сумму оценок, число отзывов и рейтинг автомобилей по таблице отзывов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        cars = Car.objects.annotate(
+            actual_sum=Coalesce(Sum('car_reviews__rating'), 0),
+            actual_count=Count('car_reviews'),
+        ).only('pk', 'rating', 'rating_sum', 'reviews_count').order_by('pk')
+
+        drifted = 0
+        batch = []
+        for car in cars.iterator(chunk_size=options['batch_size']):
+            rating = round(Decimal(car.actual_sum) / car.actual_count, 2) if car.actual_count else Decimal('0')
+            if (car.rating_sum, car.reviews_count, car.rating) == (car.actual_sum, car.actual_count, rating):
+                continue
+            drifted += 1
+            car.rating_sum, car.reviews_count, car.rating = car.actual_sum, car.actual_count, rating
+            batch.append(car)
+            if len(batch) >= options['batch_size'] and not options['dry_run']:
+                Car.objects.bulk_update(batch, ['rating_sum', 'reviews_count', 'rating'])
+                batch = []
+        if batch and not options['dry_run']:
+            Car.objects.bulk_update(batch, ['rating_sum', 'reviews_count', 'rating'])
+        if drifted and not options['dry_run']:
+            # bulk_update идёт в обход сигналов: рейтинг виден в каталоге и его ETag
+            catalogue.invalidate()
+            page_cache.purge(page_cache.CATALOGUE)
+
+        self.stdout.write(self.style.SUCCESS(f'Автомобилей с расхождением: {drifted}'))
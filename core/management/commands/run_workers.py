@@ -0,0 +1,78 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import jobs
+
+
+def worker_loop(index, stop, once):
+    connections.close_all()  # соединение родителя после fork не используем
+    name = f'{socket.gethostname()}:{os.getpid()}:{index}'
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # останавливает родитель через stop
+    while not stop.is_set():
+        try:
+            done = jobs.work_once(name)
+        except Exception:
+            jobs.logger.exception('Воркер %s: ошибка при выборке задач', name)
+            connections.close_all()
+            done = 0
+        if not done:
+            if once:
+                break
+            stop.wait(settings.JOB_POLL_INTERVAL)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркеры очереди фоновых задач (core.jobs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=os.cpu_count() or 1,
+                            help='Число процессов-воркеров')
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задачи и выйти (например, из cron)')
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        connections.close_all()
+        processes = [
+            context.Process(target=worker_loop, args=(i, stop, options['once']), daemon=True)
+            for i in range(concurrency)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Запущено воркеров: {concurrency}')
+
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        next_purge = time.monotonic()
+        try:
+            while any(process.is_alive() for process in processes) and not stop.is_set():
+                if time.monotonic() >= next_purge:
+                    self.purge()
+                    next_purge = time.monotonic() + settings.JOB_PURGE_INTERVAL
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+        for process in processes:
+            process.join()
+        if options['once'] and next_purge <= time.monotonic():
+            self.purge()
+        self.stdout.write('Воркеры остановлены')
+
+    def purge(self):
+        try:
+            deleted = jobs.purge_finished()
+        except Exception:
+            jobs.logger.exception('Не удалось удалить старые задачи')
+            connections.close_all()
+            return
+        if deleted:
+            self.stdout.write(f'Удалено старых задач: {deleted}')
@@ -0,0 +1,327 @@
+import random
+from array import array
+from bisect import bisect_right
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, Round
+from django.utils import timezone
+
+from core import fleet, occupancy
+from core.models import Car, CarCategory, CarOccupancy, Favorite, Order, Review
+
+CAR_SLUG_PREFIX = 'bench-car-'
+USER_PREFIX = 'bench-user-'
+
+# Марка: (доля в парке, модели, класс)
+BRANDS = {
+    'Toyota': (18, ['Camry', 'Corolla', 'RAV4', 'Land Cruiser'], 'Комфорт'),
+    'Hyundai': (16, ['Solaris', 'Elantra', 'Tucson', 'Sonata'], 'Эконом'),
+    'Kia': (14, ['Rio', 'Ceed', 'Sportage', 'K5'], 'Эконом'),
+    'Volkswagen': (12, ['Polo', 'Passat', 'Tiguan', 'Golf'], 'Комфорт'),
+    'Skoda': (10, ['Rapid', 'Octavia', 'Kodiaq'], 'Эконом'),
+    'BMW': (8, ['320i', '530d', 'X3', 'X5'], 'Бизнес'),
+    'Mercedes-Benz': (8, ['C180', 'E200', 'GLE', 'S500'], 'Бизнес'),
+    'Audi': (6, ['A4', 'A6', 'Q5', 'Q7'], 'Бизнес'),
+    'Porsche': (2, ['911', 'Cayenne', 'Macan'], 'Премиум'),
+}
+# Класс: медианная цена за сутки
+CLASS_PRICES = {'Эконом': 1800, 'Комфорт': 3000, 'Бизнес': 6500, 'Премиум': 15000}
+FUEL_TYPES = (['petrol', 'diesel', 'hybrid', 'electric'], [70, 18, 8, 4])
+TRANSMISSIONS = (['automatic', 'manual', 'cvt'], [65, 25, 10])
+SEATS = ([5, 7, 4, 2, 9], [78, 12, 5, 3, 2])
+RATING_COMMENTS = {
+    1: 'Машина была в плохом состоянии',
+    2: 'Были проблемы с выдачей',
+    3: 'Нормально, но есть замечания',
+    4: 'Хорошая машина, всё по договору',
+    5: 'Отлично, возьму ещё раз',
+}
+LOCATIONS = ['Центр', 'Аэропорт', 'Вокзал', 'Север', 'Юг']
+
+
+def count(value):
+    """100k, 1M, 10_000 -> int."""
+    value = value.strip().lower().replace('_', '')
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    if multiplier > 1:
+        value = value[:-1]
+    try:
+        return int(float(value) * multiplier)
+    except ValueError:
+        raise ValueError(f'Ожидается число вроде 100k или 1M: {value}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическим парком, пользователями, заказами, отзывами и избранным '
+        'для нагрузочных замеров (manage.py bench_views). Данные остаются в базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cars', type=count, default=1_000)
+        parser.add_argument('--users', type=count, default=10_000)
+        parser.add_argument('--orders', type=count, default=100_000)
+        parser.add_argument('--favorites', type=count, default=None,
+                            help='По умолчанию - по два на пользователя')
+        parser.add_argument('--review-rate', type=float, default=0.3,
+                            help='Доля завершённых заказов, по которым оставлен отзыв')
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--clear', action='store_true', help='Сначала удалить прежние данные seed_bench')
+
+    def handle(self, *args, **options):
+        if options['cars'] < 1 or options['users'] < 1:
+            raise CommandError('Нужен хотя бы один автомобиль и один пользователь')
+        if options['clear']:
+            self.clear()
+        elif User.objects.filter(username__startswith=USER_PREFIX).exists():
+            raise CommandError('Данные seed_bench уже есть; запустите с --clear')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        favorites = options['favorites']
+        if favorites is None:
+            favorites = options['users'] * 2
+        with transaction.atomic():
+            self.seed_cars(options['cars'])
+            self.seed_users(options['users'])
+            self.seed_orders(options['orders'], options['review_rate'])
+            self.seed_favorites(min(favorites, options['users'] * options['cars']))
+            self.update_counters()
+            occupancy.rebuild(self.batch_size)
+            fleet.refresh_caches()
+        self.stdout.write(self.style.SUCCESS('Готово'))
+
+    def clear(self):
+        # Сигналы заказов пересчитывают занятость по каждой строке, поэтому удаляем SQL
+        cars = f'SELECT id FROM {Car._meta.db_table} WHERE slug LIKE %s'
+        users = f'SELECT id FROM {User._meta.db_table} WHERE username LIKE %s'
+        car_pattern, user_pattern = f'{CAR_SLUG_PREFIX}%', f'{USER_PREFIX}%'
+        statements = [
+            (f'DELETE FROM {CarOccupancy._meta.db_table} WHERE car_id IN ({cars})', [car_pattern]),
+            *(
+                (f'DELETE FROM {model._meta.db_table} WHERE car_id IN ({cars}) OR user_id IN ({users})',
+                 [car_pattern, user_pattern])
+                for model in (Review, Favorite, Order)
+            ),
+            (f'DELETE FROM {Car._meta.db_table} WHERE id IN ({cars})', [car_pattern]),
+            (f'DELETE FROM {User._meta.db_table} WHERE id IN ({users})', [user_pattern]),
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            for sql, params in statements:
+                cursor.execute(sql, params)
+        fleet.refresh_caches()
+        self.stdout.write('Прежние данные seed_bench удалены')
+
+    def insert(self, model, objects, label, total):
+        """bulk_create пачками; возвращает pk созданных строк (объекты не копятся в памяти)."""
+        pks = []
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                pks.extend(obj.pk for obj in model.objects.bulk_create(batch))
+                batch = []
+                self.progress(label, len(pks), total)
+        if batch:
+            pks.extend(obj.pk for obj in model.objects.bulk_create(batch))
+            self.progress(label, len(pks), total)
+        return pks
+
+    def progress(self, label, done, total):
+        if done == total or done % (self.batch_size * 20) == 0:
+            self.stdout.write(f'{label}: {done} из {total}')
+
+    def seed_cars(self, total):
+        categories = {
+            name: CarCategory.objects.get_or_create(name=name)[0].pk for name in CLASS_PRICES
+        }
+        brands = list(BRANDS)
+        weights = [BRANDS[brand][0] for brand in brands]
+        self.car_prices = []
+
+        def cars():
+            for i in range(total):
+                brand = self.rng.choices(brands, weights)[0]
+                _, models, car_class = BRANDS[brand]
+                model = self.rng.choice(models)
+                # Больше свежих машин; цена - логнормальная вокруг медианы класса
+                year = max(2008, self.now.year - int(self.rng.expovariate(1 / 4)))
+                age_discount = 1 - min(0.5, (self.now.year - year) * 0.04)
+                price = CLASS_PRICES[car_class] * age_discount * self.rng.lognormvariate(0, 0.25)
+                price = Decimal(round(price, -2) or 100)
+                self.car_prices.append(price)
+                yield Car(
+                    name=f'{brand} {model}', brand=brand, model=model, year=year,
+                    category_id=categories[car_class], price_per_day=price,
+                    available=self.rng.random() < 0.95,
+                    fuel_type=self.rng.choices(*FUEL_TYPES)[0],
+                    transmission=self.rng.choices(*TRANSMISSIONS)[0],
+                    seats=self.rng.choices(*SEATS)[0],
+                    gps=self.rng.random() < 0.6, bluetooth=self.rng.random() < 0.8,
+                    description=f'{brand} {model} {year} года, {car_class.lower()}-класс',
+                    slug=f'{CAR_SLUG_PREFIX}{i}',
+                )
+
+        self.car_ids = self.insert(Car, cars(), 'Автомобили', total)
+        self.car_index = {pk: i for i, pk in enumerate(self.car_ids)}
+        # Средняя оценка машины: большинство хорошие, часть заметно хуже
+        self.car_quality = [min(5.0, self.rng.gauss(4.2, 0.5)) for _ in self.car_ids]
+
+    def seed_users(self, total):
+        users = (
+            User(username=f'{USER_PREFIX}{i}', email=f'{USER_PREFIX}{i}@example.com',
+                 password=UNUSABLE_PASSWORD_PREFIX)
+            for i in range(total)
+        )
+        self.user_ids = self.insert(User, users, 'Пользователи', total)
+
+    def skewed(self, size, power):
+        """Индекс с перекосом к началу: немногие пользователи и машины дают большую часть заказов."""
+        return min(size - 1, int(size * self.rng.random() ** power))
+
+    # Попыток найти свободный слот: первые - на той же машине, затем на других
+    SLOT_ATTEMPTS = 10
+    SAME_CAR_ATTEMPTS = 3
+
+    def take_slot(self, car, start, end):
+        """Занимает [start, end) машины, если он не пересекается с уже выданными заказами."""
+        # Границы заказов - целые часы от эпохи подряд: начало, конец, начало, конец...
+        # Заказы не пересекаются, поэтому массив отсортирован, и нечётная позиция
+        # начала значит, что оно попало внутрь чужого заказа
+        bounds = self.car_slots.get(car)
+        if bounds is None:
+            bounds = self.car_slots[car] = array('q')
+        start, end = int(start.timestamp()) // 3600, int(end.timestamp()) // 3600
+        i = bisect_right(bounds, start)
+        if i % 2 or (i < len(bounds) and bounds[i] < end):
+            return False
+        bounds[i:i] = array('q', (start, end))
+        return True
+
+    def seed_orders(self, total, review_rate):
+        self.reviewed = set()
+        # Машина -> границы её неотменённых заказов в часах (take_slot); 16 байт на заказ
+        self.car_slots = {}
+        self.slot_conflicts = 0
+        span = timedelta(days=3 * 365).total_seconds()
+        horizon = timedelta(days=90).total_seconds()
+
+        def draw_period():
+            start = self.now - timedelta(seconds=span) + timedelta(
+                seconds=self.rng.uniform(0, span + horizon),
+            )
+            start = start.replace(minute=0, second=0, microsecond=0)
+            days = min(30, 1 + int(self.rng.expovariate(1 / 3)))
+            return start, days
+
+        def status_for(start, end):
+            if end < self.now:
+                return 'completed' if self.rng.random() < 0.85 else 'cancelled'
+            if start < self.now:
+                return 'active'
+            return self.rng.choices(['pending', 'confirmed', 'cancelled'], [30, 60, 10])[0]
+
+        def orders():
+            for _ in range(total):
+                user = self.skewed(len(self.user_ids), 2)
+                car = self.skewed(len(self.car_ids), 1.5)
+                start, days = draw_period()
+                # Машина не бывает в двух арендах сразу: неотменённые заказы одной машины
+                # не пересекаются. Не нашлось слота - заказ отменён (отменённым можно)
+                for attempt in range(self.SLOT_ATTEMPTS):
+                    if attempt:
+                        if attempt >= self.SAME_CAR_ATTEMPTS:
+                            car = self.skewed(len(self.car_ids), 1.5)
+                        start, days = draw_period()
+                    end = start + timedelta(days=days)
+                    status = status_for(start, end)
+                    if status == 'cancelled' or self.take_slot(car, start, end):
+                        break
+                else:
+                    status = 'cancelled'
+                    self.slot_conflicts += 1
+                extras = {
+                    'child_seat': self.rng.random() < 0.1,
+                    'insurance': self.rng.random() < 0.3,
+                }
+                yield Order(
+                    user_id=self.user_ids[user], car_id=self.car_ids[car],
+                    start_date=start, end_date=end,
+                    pickup_location=self.rng.choice(LOCATIONS), return_location=self.rng.choice(LOCATIONS),
+                    total_price=self.car_prices[car] * days, status=status,
+                    phone='+7 900 000-00-00', email='bench@example.com', **extras,
+                )
+
+        # Отзывы пишутся по мере вставки заказов, чтобы не держать все заказы в памяти
+        batch = []
+        done = 0
+        for order in orders():
+            batch.append(order)
+            if len(batch) >= self.batch_size:
+                done += self.insert_orders(batch, review_rate)
+                batch = []
+                self.progress('Заказы', done, total)
+        if batch:
+            done += self.insert_orders(batch, review_rate)
+            self.progress('Заказы', done, total)
+        if self.slot_conflicts:
+            self.stdout.write(f'Заказов без свободного слота (отменены): {self.slot_conflicts}')
+
+    def insert_orders(self, batch, review_rate):
+        Order.objects.bulk_create(batch)
+        reviews = []
+        for order in batch:
+            pair = (order.user_id, order.car_id)
+            if order.status != 'completed' or pair in self.reviewed or self.rng.random() >= review_rate:
+                continue
+            self.reviewed.add(pair)
+            quality = self.car_quality[self.car_index[order.car_id]]
+            rating = max(1, min(5, round(self.rng.gauss(quality, 0.8))))
+            reviews.append(Review(
+                user_id=order.user_id, car_id=order.car_id, order_id=order.pk,
+                rating=rating, comment=RATING_COMMENTS[rating],
+            ))
+        Review.objects.bulk_create(reviews)
+        return len(batch)
+
+    def seed_favorites(self, total):
+        pairs = set()
+        attempts = 0
+        # При почти полном заполнении пар случайный выбор не сходится
+        while len(pairs) < total and attempts < total * 10:
+            attempts += 1
+            pairs.add((
+                self.user_ids[self.skewed(len(self.user_ids), 1.5)],
+                self.car_ids[self.skewed(len(self.car_ids), 1.5)],
+            ))
+        favorites = (Favorite(user_id=user_id, car_id=car_id) for user_id, car_id in pairs)
+        self.insert(Favorite, favorites, 'Избранное', len(pairs))
+
+    def update_counters(self):
+        """Рейтинг и счётчики машин одним UPDATE по отзывам и избранному (сигналы при bulk_create не срабатывают)."""
+        def aggregate(model, expression):
+            return Coalesce(Subquery(
+                model.objects.filter(car=OuterRef('pk')).order_by().values('car')
+                .annotate(value=expression).values('value')
+            ), 0)
+
+        cars = Car.objects.filter(slug__startswith=CAR_SLUG_PREFIX)
+        cars.update(
+            rating_sum=aggregate(Review, Sum('rating')),
+            reviews_count=aggregate(Review, Count('pk')),
+            favorites_count=aggregate(Favorite, Count('pk')),
+            updated_at=self.now,
+        )
+        # Иначе деление целочисленное; Round сам приводит float к numeric на PostgreSQL
+        cars.filter(reviews_count__gt=0).update(
+            rating=Round(Cast('rating_sum', FloatField()) / F('reviews_count'), 2),
+        )
+        self.stdout.write(f'Отзывов: {len(self.reviewed)}')
@@ -0,0 +1,246 @@
+"""
+Метрики в формате Prometheus (text exposition 0.0.4) без внешних библиотек.
+
+Счётчики, гистограммы и gauge живут в памяти процесса под одной
+блокировкой. Под несколькими процессами WSGI задайте METRICS_DIR:
+каждый процесс раз в METRICS_FLUSH_INTERVAL секунд (и при выходе)
+атомарно перезаписывает свой снимок metrics-<pid>-<старт>.json, а
+/metrics складывает снимки всех процессов. Счётчики и гистограммы
+умерших процессов продолжают учитываться, их gauge - нет. Без
+METRICS_DIR /metrics показывает только свой процесс.
+
+MetricsMiddleware меряет время ответа по имени маршрута
+(resolver_match.view_name), считает SQL-запросы по базам и отмечает,
+открыто ли постоянное соединение к началу запроса. События воронки
+бронирования, отзывов, избранного и входа пишут представления и
+сигналы auth; попадания в кеши - модули кешей через cache_lookup().
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+REGISTRY = {}
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}  # кортеж значений меток -> значение
+        REGISTRY[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            # Счётчики по корзинам (не накопительные), затем сумма и число наблюдений
+            state = self.values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0, 0])
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Время ответа по имени маршрута', ['view', 'method'],
+)
+REQUESTS = Counter('http_requests_total', 'Ответы по имени маршрута и классу статуса', ['view', 'method', 'status'])
+DB_QUERIES = Counter('db_queries_total', 'SQL-запросы', ['db'])
+DB_CONNECTIONS = Gauge('db_connections_open', 'Открытые соединения с базой', ['db'])
+CACHE_REQUESTS = Counter('cache_requests_total', 'Обращения к кешам приложения', ['cache', 'result'])
+BOOKING_FUNNEL = Counter('booking_funnel_total', 'Шаги бронирования', ['step'])
+ORDERS_CREATED = Counter('orders_created_total', 'Созданные заказы', ['status'])
+REVIEWS = Counter('reviews_total', 'Сохранённые отзывы', ['action'])
+FAVORITE_TOGGLES = Counter('favorite_toggles_total', 'Переключения избранного', ['action'])
+AUTH_EVENTS = Counter('auth_events_total', 'Вход, выход и регистрация', ['event'])
+
+
+def cache_lookup(cache_name, hit):
+    CACHE_REQUESTS.inc(cache=cache_name, result='hit' if hit else 'miss')
+
+
+# Снимки процессов (METRICS_DIR)
+
+_started = time.time_ns()
+_last_flush = 0.0
+
+
+def _snapshot():
+    with _lock:
+        return {
+            name: [[list(key), value] for key, value in metric.values.items()]
+            for name, metric in REGISTRY.items()
+        }
+
+
+def _snapshot_path():
+    return os.path.join(settings.METRICS_DIR, f'metrics-{os.getpid()}-{_started}.json')
+
+
+def flush(force=False):
+    global _last_flush
+    if not settings.METRICS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < settings.METRICS_FLUSH_INTERVAL:
+        return
+    _last_flush = now
+    path = _snapshot_path()
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp, path)
+
+
+atexit.register(lambda: flush(force=True))
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(total, metric, values, include_gauges):
+    for key, value in values:
+        key = tuple(key)
+        if metric.kind == 'gauge':
+            if include_gauges:
+                total[key] = total.get(key, 0) + value
+        elif metric.kind == 'histogram':
+            state = total.setdefault(key, [0] * len(value))
+            for i, item in enumerate(value):
+                state[i] += item
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def collect():
+    """{имя метрики: {метки: значение}} по всем процессам."""
+    merged = {name: {} for name in REGISTRY}
+    own = _snapshot()
+    for name, values in own.items():
+        _merge(merged[name], REGISTRY[name], values, include_gauges=True)
+    if settings.METRICS_DIR:
+        own_path = _snapshot_path()
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, 'metrics-*.json')):
+            if path == own_path:
+                continue
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _process_alive(int(os.path.basename(path).split('-')[1]))
+            for name, values in snapshot.items():
+                if name in REGISTRY:
+                    _merge(merged[name], REGISTRY[name], values, include_gauges=alive)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(metric, key, extra=()):
+    pairs = [*zip(metric.labels, key), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def render():
+    lines = []
+    for name, values in collect().items():
+        metric = REGISTRY[name]
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for key, value in sorted(values.items()):
+            if metric.kind != 'histogram':
+                lines.append(f'{name}{_labels(metric, key)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip([*metric.buckets, '+Inf'], value):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(metric, key, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(metric, key)} {value[-2]}')
+            lines.append(f'{name}_count{_labels(metric, key)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+# Остальные методы (в т.ч. произвольные строки от клиентов) - одна метка other
+METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def count_query(self, execute, sql, params, many, context):
+        DB_QUERIES.inc(db=context['connection'].alias)
+        return execute(sql, params, many, context)
+
+    def __call__(self, request):
+        # До первого запроса: открыто ли постоянное соединение с прошлого запроса
+        for connection in connections.all():
+            DB_CONNECTIONS.set(int(connection.connection is not None), db=connection.alias)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.count_query))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        # Без маршрута (404) - одна метка, чтобы случайные URL не плодили ряды
+        view = match.view_name if match else '<unmatched>'
+        method = request.method if request.method in METHODS else 'other'
+        REQUEST_DURATION.observe(duration, view=view, method=method)
+        REQUESTS.inc(view=view, method=method, status=f'{response.status_code // 100}xx')
+        flush()
+        return response
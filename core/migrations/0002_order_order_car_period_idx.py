@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['car', 'status', 'start_date', 'end_date'], name='order_car_period_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:29
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_occupancy(apps, schema_editor):
+    Order = apps.get_model('core', 'Order')
+    CarOccupancy = apps.get_model('core', 'CarOccupancy')
+    rows = []
+    for order in Order.objects.filter(status__in=['pending', 'confirmed', 'active']).iterator():
+        first = timezone.localdate(order.start_date)
+        last = timezone.localdate(order.end_date - timedelta(microseconds=1))
+        for i in range((last - first).days + 1):
+            rows.append(CarOccupancy(order_id=order.pk, car_id=order.car_id, day=first + timedelta(days=i)))
+    CarOccupancy.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_order_order_car_period_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='core.car')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='core.order')),
+            ],
+            options={
+                'verbose_name_plural': 'Car Occupancy',
+                'indexes': [models.Index(fields=['day', 'car'], name='occupancy_day_car_idx')],
+            },
+        ),
+        migrations.RunPython(fill_occupancy, migrations.RunPython.noop),
+    ]
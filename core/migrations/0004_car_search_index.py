@@ -0,0 +1,47 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE core_car_fts USING fts5("
+            "name, brand, model, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO core_car_fts (rowid, name, brand, model, description) "
+            "SELECT id, name, brand, model, description FROM core_car"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE core_car_search ("
+            "car_id bigint PRIMARY KEY REFERENCES core_car (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute("CREATE INDEX core_car_search_document_gin ON core_car_search USING GIN (document)")
+        schema_editor.execute(
+            "INSERT INTO core_car_search (car_id, document) SELECT id, "
+            "setweight(to_tsvector('simple', coalesce(brand, '') || ' ' || coalesce(model, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(name, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(description, '')), 'D') "
+            "FROM core_car"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS core_car_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS core_car_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_caroccupancy'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:36
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_sum(apps, schema_editor):
+    Car = apps.get_model('core', 'Car')
+    Review = apps.get_model('core', 'Review')
+    totals = Review.objects.filter(car=OuterRef('pk')).values('car').annotate(total=Sum('rating')).values('total')
+    Car.objects.update(rating_sum=Coalesce(Subquery(totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_car_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rating_sum, migrations.RunPython.noop),
+    ]
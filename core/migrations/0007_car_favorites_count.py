@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:42
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_favorites_count(apps, schema_editor):
+    Car = apps.get_model('core', 'Car')
+    Favorite = apps.get_model('core', 'Favorite')
+    counts = Favorite.objects.filter(car=OuterRef('pk')).values('car').annotate(total=Count('pk')).values('total')
+    Car.objects.update(favorites_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_car_available_rating_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='favorites_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_favorites_count, migrations.RunPython.noop),
+    ]
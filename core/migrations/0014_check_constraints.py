@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:10
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+BLOCKING_STATUSES = ('pending', 'confirmed', 'active')
+
+
+def fix_invalid_rows(apps, schema_editor):
+    """
+    Строки, которые нарушили бы ограничения: до проверки в форме
+    бронирования можно было сохранить заказ с окончанием не позже
+    начала, а из админки - отрицательную цену или оценку вне 1..5.
+    """
+    Car = apps.get_model('core', 'Car')
+    Order = apps.get_model('core', 'Order')
+    Review = apps.get_model('core', 'Review')
+    CarOccupancy = apps.get_model('core', 'CarOccupancy')
+
+    Car.objects.filter(price_per_day__lt=0).update(price_per_day=0)
+
+    # Такой заказ никогда не был настоящей бронью: отменяем его и даём ему час,
+    # чтобы период стал допустимым
+    invalid_orders = Order.objects.filter(end_date__lte=F('start_date'))
+    CarOccupancy.objects.filter(order__in=invalid_orders).delete()
+    invalid_orders.filter(status__in=BLOCKING_STATUSES).update(status='cancelled')
+    invalid_orders.update(end_date=F('start_date') + timedelta(hours=1))
+
+    # Оценку приводим в 1..5 и пересчитываем рейтинг затронутых машин
+    invalid_reviews = Review.objects.filter(Q(rating__lt=1) | Q(rating__gt=5))
+    car_ids = list(invalid_reviews.values_list('car_id', flat=True).distinct())
+    invalid_reviews.filter(rating__lt=1).update(rating=1)
+    invalid_reviews.filter(rating__gt=5).update(rating=5)
+    if car_ids:
+        reviews = Review.objects.filter(car=OuterRef('pk')).values('car')
+        Car.objects.filter(pk__in=car_ids).update(
+            rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+            reviews_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), 0),
+        )
+        for car in Car.objects.filter(pk__in=car_ids):
+            car.rating = round(car.rating_sum / car.reviews_count, 2) if car.reviews_count else 0
+            car.save(update_fields=['rating'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_job_status_finished_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(fix_invalid_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='car',
+            constraint=models.CheckConstraint(condition=models.Q(('price_per_day__gte', 0)), name='car_price_non_negative'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.CheckConstraint(condition=models.Q(('end_date__gt', models.F('start_date'))), name='order_end_after_start'),
+        ),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.CheckConstraint(condition=models.Q(('rating__gte', 1), ('rating__lte', 5)), name='review_rating_range'),
+        ),
+    ]
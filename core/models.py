@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models import F, Q
+from django.utils.text import slugify
 
 
 class CarCategory(models.Model):
@@ -15,6 +17,33 @@ class CarCategory(models.Model):
         return self.name
 
 
+class CarQuerySet(models.QuerySet):
+    def available_between(self, start, end):
+        """Автомобили, свободные на весь интервал [start, end)."""
+        busy = Order.objects.overlapping(start, end).values('car_id')
+        return self.filter(available=True).exclude(pk__in=busy)
+    
+    def slug_counters(self, bases):
+        """
+        {base: наибольший занятый номер} для слагов вида base, base-2, base-3...
+        (base без номера считается первым, 0 - слаг свободен).
+        """
+        counters = dict.fromkeys(bases, 0)
+        bases = list(counters)
+        for i in range(0, len(bases), 100):
+            condition = Q()
+            for base in bases[i:i + 100]:
+                condition |= Q(slug=base) | Q(slug__startswith=f'{base}-')
+            for slug in self.filter(condition).values_list('slug', flat=True):
+                if slug in counters:
+                    counters[slug] = max(counters[slug], 1)
+                    continue
+                base, _, number = slug.rpartition('-')
+                if base in counters and number.isdigit():
+                    counters[base] = max(counters[base], int(number))
+        return counters
+
+
 class Car(models.Model):
     FUEL_CHOICES = [
         ('petrol', 'Бензин'),
@@ -60,16 +89,39 @@ class Car(models.Model):
     # SEO
     slug = models.SlugField(max_length=200, unique=True, blank=True)
     
+    # Ключ во внешней системе учёта парка (manage.py import_cars)
+    external_id = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    
     # Рейтинг
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00, 
                                 validators=[MinValueValidator(0), MaxValueValidator(5)])
     reviews_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)  # сумма оценок, см. core.ratings
+    favorites_count = models.IntegerField(default=0)  # см. core.favorites
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CarQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Каталог показывает только доступные машины: частичные индексы
+            # под каждый порядок из catalogue.ORDERINGS (см. core.query_plans)
+            models.Index(fields=['-created_at', '-id'], condition=Q(available=True), name='car_avail_created_idx'),
+            models.Index(fields=['price_per_day', 'id'], condition=Q(available=True), name='car_avail_price_idx'),
+            models.Index(fields=['-rating', '-id'], condition=Q(available=True), name='car_avail_rating_idx'),
+            models.Index(fields=['-year', '-id'], condition=Q(available=True), name='car_avail_year_idx'),
+            # Похожие автомобили на странице машины
+            models.Index(fields=['brand', '-created_at'], condition=Q(available=True), name='car_avail_brand_idx'),
+            # Фильтры списка в админке
+            models.Index(fields=['brand'], name='car_brand_idx'),
+            models.Index(fields=['year'], name='car_year_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=Q(price_per_day__gte=0), name='car_price_non_negative'),
+        ]
     
     def __str__(self):
         return f"{self.brand} {self.model} ({self.year})"
@@ -77,12 +129,32 @@ class Car(models.Model):
     def get_absolute_url(self):
         return reverse('core:car_detail', kwargs={'pk': self.pk, 'slug': self.slug})
     
+    @staticmethod
+    def slug_base(brand, model, year):
+        return slugify(f"{brand} {model} {year}")[:190] or 'car'
+    
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = f"{self.brand}-{self.model}-{self.year}".lower().replace(' ', '-')
+        # Номер слага ищется только для машины без слага и только если слаг будет сохранён
+        update_fields = kwargs.get('update_fields')
+        if not self.slug and (update_fields is None or 'slug' in update_fields):
+            base = self.slug_base(self.brand, self.model, self.year)
+            taken = Car.objects.exclude(pk=self.pk).slug_counters([base])[base]
+            self.slug = f'{base}-{taken + 1}' if taken else base
         super().save(*args, **kwargs)
 
 
+class OrderQuerySet(models.QuerySet):
+    def blocking(self):
+        return self.filter(status__in=Order.BLOCKING_STATUSES)
+    
+    def overlapping(self, start, end, car=None):
+        """Заказы, занимающие автомобиль хотя бы частично в интервале [start, end)."""
+        qs = self.blocking().filter(start_date__lt=end, end_date__gt=start)
+        if car is not None:
+            qs = qs.filter(car=car)
+        return qs
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Ожидает подтверждения'),
@@ -92,6 +164,9 @@ class Order(models.Model):
         ('cancelled', 'Отменено'),
     ]
     
+    # Статусы, при которых автомобиль считается занятым
+    BLOCKING_STATUSES = ('pending', 'confirmed', 'active')
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     car = models.ForeignKey(Car, on_delete=models.CASCADE)
     start_date = models.DateTimeField()
@@ -114,15 +189,46 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = OrderQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['car', 'status', 'start_date', 'end_date'], name='order_car_period_idx'),
+            # Сортировка и фильтр по статусу в админке и выгрузках (core.reports)
+            models.Index(fields=['-created_at'], name='order_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+            # Мои заказы и проверка аренды перед отзывом (add_review)
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            models.Index(fields=['user', 'car', 'status'], name='order_user_car_status_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=Q(end_date__gt=F('start_date')), name='order_end_after_start'),
+        ]
     
     def __str__(self):
         return f"Заказ #{self.id} - {self.car} для {self.user.username}"
     
     @property
     def duration_days(self):
-        return (self.end_date - self.start_date).days + 1
+        from .pricing import billing_period
+        return billing_period(self.start_date, self.end_date)[1]
+
+
+class CarOccupancy(models.Model):
+    """Занятость автомобиля по дням; поддерживается из сигналов Order (core.occupancy)."""
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='occupancy')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='occupancy')
+    day = models.DateField()
+    
+    class Meta:
+        verbose_name_plural = "Car Occupancy"
+        indexes = [
+            models.Index(fields=['day', 'car'], name='occupancy_day_car_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.car} - {self.day}"
 
 
 class Review(models.Model):
@@ -132,10 +238,20 @@ class Review(models.Model):
     rating = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Правка отзыва меняет ответ API, не трогая created_at и id (ETag, core.api)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ('user', 'car')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='review_created_idx'),
+            # Последние отзывы на странице машины и в API
+            models.Index(fields=['car', '-created_at'], name='review_car_created_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=Q(rating__gte=1, rating__lte=5), name='review_rating_range'),
+        ]
     
     def __str__(self):
         return f"Отзыв от {self.user.username} на {self.car}"
@@ -148,6 +264,9 @@ class Favorite(models.Model):
     
     class Meta:
         unique_together = ('user', 'car')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='favorite_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.car}"
@@ -163,3 +282,48 @@ class UserProfile(models.Model):
     
     def __str__(self):
         return f"Профиль {self.user.username}"
+
+
+class ImageDerivative(models.Model):
+    """Уменьшенные копии загруженного файла; создаются в core.images."""
+    source = models.CharField(max_length=255, unique=True)  # имя файла в MEDIA_ROOT
+    digest = models.CharField(max_length=64, db_index=True)  # sha256 содержимого
+    widths = models.JSONField(default=list)
+    formats = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.source
+
+
+class Job(models.Model):
+    """Фоновая задача; очередь и воркеры - core.jobs."""
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает'),
+        ('running', 'Выполняется'),
+        ('done', 'Выполнена'),
+        ('failed', 'Ошибка'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Повторная постановка с тем же ключом не создаёт вторую задачу
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+            models.Index(fields=['status', 'finished_at'], name='job_status_finished_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
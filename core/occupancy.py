@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CarOccupancy, Order
+
+
+def order_days(order):
+    """Календарные дни (по местному времени), которые занимает заказ."""
+    first = timezone.localdate(order.start_date)
+    last = timezone.localdate(order.end_date - timedelta(microseconds=1))
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def refresh_order(order):
+    with transaction.atomic():
+        CarOccupancy.objects.filter(order_id=order.pk).delete()
+        if order.status in Order.BLOCKING_STATUSES:
+            CarOccupancy.objects.bulk_create(
+                CarOccupancy(order_id=order.pk, car_id=order.car_id, day=day)
+                for day in order_days(order)
+            )
+
+
+def clear_order(order_id):
+    CarOccupancy.objects.filter(order_id=order_id).delete()
+
+
+def busy_car_ids(start_day, end_day):
+    """Подзапрос id автомобилей, занятых хотя бы в один день из [start_day, end_day]."""
+    return CarOccupancy.objects.filter(day__gte=start_day, day__lte=end_day).values('car_id')
+
+
+def rebuild(batch_size=5000):
+    with transaction.atomic():
+        CarOccupancy.objects.all().delete()
+        rows = []
+        orders = Order.objects.blocking().only('pk', 'car_id', 'start_date', 'end_date')
+        for order in orders.iterator(chunk_size=batch_size):
+            rows.extend(
+                CarOccupancy(order_id=order.pk, car_id=order.car_id, day=day)
+                for day in order_days(order)
+            )
+            if len(rows) >= batch_size:
+                CarOccupancy.objects.bulk_create(rows)
+                rows = []
+        CarOccupancy.objects.bulk_create(rows)
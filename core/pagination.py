@@ -0,0 +1,213 @@
+"""
+Keyset-пагинация (по курсору).
+
+Вместо OFFSET и COUNT(*) страница выбирается условием по значениям
+сортировки последней показанной строки, поэтому глубокие страницы
+стоят столько же, сколько первая, а новые записи не сдвигают выдачу.
+Курсор - непрозрачная base64-строка со значениями полей сортировки.
+Сортировка должна заканчиваться уникальным полем (обычно id).
+"""
+import base64
+import datetime
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _cursor_value(value):
+    # Без потерь: DjangoJSONEncoder обрезает микросекунды до миллисекунд
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def approximate_count(queryset, cap=1000):
+    """
+    Оценка числа строк без полного COUNT(*).
+
+    На PostgreSQL берётся оценка планировщика из EXPLAIN, на остальных
+    СУБД - COUNT с ограничением сверху. Возвращает (число, is_estimate).
+    """
+    if connection.vendor == 'postgresql':
+        plan = json.loads(queryset.explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows']), True
+    count = queryset.order_by()[:cap + 1].count()
+    return min(count, cap), count > cap
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator с номерами страниц для больших таблиц (админка). На PostgreSQL
+    число строк - оценка планировщика, если она больше
+    ADMIN_COUNT_ESTIMATE_THRESHOLD; на маленьких выборках и других СУБД -
+    обычный COUNT(*).
+    """
+
+    @cached_property
+    def count(self):
+        if connection.vendor == 'postgresql' and hasattr(self.object_list, 'explain'):
+            estimate, _ = approximate_count(self.object_list)
+            if estimate > settings.ADMIN_COUNT_ESTIMATE_THRESHOLD:
+                return estimate
+        return Paginator.count.func(self)
+
+
+class CursorPage:
+    cursor_based = True
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    def __init__(self, queryset, per_page, ordering, count_mode='approximate'):
+        self.object_list = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.count_mode = count_mode
+        self.fields = [
+            (name.lstrip('-'), name.startswith('-')) for name in self.ordering
+        ]
+
+    @cached_property
+    def _count(self):
+        if self.count_mode == 'exact':
+            return self.object_list.count(), False
+        return approximate_count(self.object_list)
+
+    @property
+    def count(self):
+        return self._count[0]
+
+    @property
+    def count_is_estimate(self):
+        return self._count[1]
+
+    @property
+    def count_display(self):
+        count, is_estimate = self._count
+        if not is_estimate:
+            return str(count)
+        if connection.vendor == 'postgresql':
+            return f'≈{count}'
+        return f'{count}+'
+
+    def encode_cursor(self, obj, direction):
+        values = [_cursor_value(getattr(obj, name)) for name, _ in self.fields]
+        payload = json.dumps({'d': direction, 'v': values})
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            direction, raw_values = payload['d'], payload['v']
+            if direction not in ('next', 'prev') or len(raw_values) != len(self.fields):
+                raise ValueError
+            opts = self.object_list.model._meta
+            values = [
+                opts.get_field(name).to_python(value)
+                for (name, _), value in zip(self.fields, raw_values)
+            ]
+        except Exception as exc:
+            raise InvalidCursor(cursor) from exc
+        return direction, values
+
+    def keyset_filter(self, values, backwards):
+        """(a, b) после (va, vb): a > va OR (a = va AND b > vb) с учётом направлений."""
+        condition = Q()
+        for i, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending != backwards else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[i]})
+            for j in range(i):
+                step &= Q(**{self.fields[j][0]: values[j]})
+            condition |= step
+        return condition
+
+    def page_queryset(self, direction='next', values=None):
+        """Запрос страницы (на одну строку больше, чтобы узнать, есть ли следующая)."""
+        backwards = direction == 'prev'
+        ordering = self.ordering
+        if backwards:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+        queryset = self.object_list.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(values, backwards))
+        return queryset[:self.per_page + 1]
+
+    def page(self, cursor=None):
+        direction, values = ('next', None)
+        if cursor:
+            direction, values = self.decode_cursor(cursor)
+        backwards = direction == 'prev'
+
+        items = list(self.page_queryset(direction, values))
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if backwards:
+            items.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        return CursorPage(
+            items, self,
+            next_cursor=self.encode_cursor(items[-1], 'next') if items and has_next else None,
+            previous_cursor=self.encode_cursor(items[0], 'prev') if items and has_previous else None,
+        )
+
+    def get_page(self, cursor=None):
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page()
+
+
+def get_paginator(queryset, per_page, view_name, ordering=None):
+    """
+    Курсорный пагинатор, если он включён для view в CURSOR_PAGINATION
+    и известна сортировка, иначе обычный Paginator с номерами страниц.
+    """
+    if ordering and getattr(settings, 'CURSOR_PAGINATION', {}).get(view_name):
+        return CursorPaginator(queryset, per_page, ordering)
+    return Paginator(queryset, per_page)
+
+
+def paginate(request, queryset, per_page, view_name, ordering=None):
+    """Страница для view (см. get_paginator)."""
+    paginator = get_paginator(queryset, per_page, view_name, ordering)
+    if isinstance(paginator, CursorPaginator):
+        return paginator.get_page(request.GET.get('cursor'))
+    return paginator.get_page(request.GET.get('page'))
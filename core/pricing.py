@@ -0,0 +1,263 @@
+"""
+Расчёт стоимости аренды.
+
+Срок аренды округляется вверх до часов, а дни считаются блоками по
+24 часа. Тарифы:
+- почасовой: меньше суток, если у машины задан price_per_hour (не дороже суток);
+- посуточный;
+- понедельный: полная неделя стоит PRICING_WEEK_PRICE_IN_DAYS суток.
+Сезонный коэффициент (PRICING_SEASONS) берётся средним по дням аренды
+из таблицы префиксных сумм по дням года (по одной для обычного и
+високосного года) и округляется до 4 знаков. Срок аренды ограничен
+PRICING_MAX_DAYS (check_period). Скидка за длительную аренду
+(PRICING_LONG_RENTAL_DISCOUNTS) применяется к стоимости машины, доп.
+услуги (EXTRAS) считаются посуточно. Правила задаются в settings.
+
+quote_many() считает цены для списка машин одним векторным проходом
+NumPy: период и сезон общие, различаются только ставки машин. Деньги
+считаются в целых копейках (int64), коэффициенты - в десятитысячных
+долях с округлением половины вверх, поэтому итог совпадает до копейки
+с тем, что сохраняется в Order.total_price. Ставки
+одной машины для /api/quote/ берутся из кеша (get_rates), без загрузки
+модели; сбрасывают их сигналы Car (core.signals).
+"""
+import calendar
+import datetime
+import math
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import metrics
+from .models import Car
+
+# Доп. услуги: поле заказа -> название и цена в сутки
+EXTRAS = {
+    'child_seat': {'label': 'Детское кресло', 'per_day': Decimal('500')},
+    'additional_driver': {'label': 'Дополнительный водитель', 'per_day': Decimal('300')},
+    'insurance': {'label': 'Расширенная страховка', 'per_day': Decimal('800')},
+}
+
+CURRENCY = 'сом'
+
+
+def extra_label(name):
+    extra = EXTRAS[name]
+    return f"{extra['label']} (+{extra['per_day']:.0f} {CURRENCY}/день)"
+
+
+def billing_period(start, end):
+    """(часы, сутки) аренды: часы округляются вверх, сутки - блоки по 24 часа."""
+    hours = max(1, math.ceil((end - start).total_seconds() / 3600))
+    return hours, math.ceil(hours / 24)
+
+
+def check_period(start, end):
+    """ValueError с текстом для пользователя, если период аренды недопустим."""
+    if end <= start:
+        raise ValueError('Дата окончания должна быть позже даты начала.')
+    if end - start > datetime.timedelta(days=settings.PRICING_MAX_DAYS):
+        raise ValueError(f'Срок аренды не больше {settings.PRICING_MAX_DAYS} дней.')
+
+
+class SeasonTable:
+    """
+    Сезонные коэффициенты по дням года с префиксными суммами: сезоны
+    задаются датами в году, поэтому все обычные (и все високосные) годы
+    одинаковы и таблиц всего две, каким бы ни был период.
+    """
+
+    def __init__(self, seasons):
+        self.seasons = seasons
+        self.cumsum = {leap: self._year_cumsum(2000 if leap else 2001, seasons) for leap in (False, True)}
+
+    @staticmethod
+    def _year_cumsum(year, seasons):
+        first_day = datetime.date(year, 1, 1)
+        days = 366 if calendar.isleap(year) else 365
+        multipliers = [season_multiplier(first_day + datetime.timedelta(days=i), seasons) for i in range(days)]
+        return np.concatenate(([0.0], np.cumsum(multipliers)))
+
+    def _sum(self, year, first_offset, last_offset):
+        """Сумма коэффициентов дней года с first_offset по last_offset включительно."""
+        cumsum = self.cumsum[calendar.isleap(year)]
+        return float(cumsum[last_offset + 1] - cumsum[first_offset])
+
+    def mean(self, first_day, days):
+        last_day = first_day + datetime.timedelta(days=days - 1)
+        first_offset = first_day.timetuple().tm_yday - 1
+        last_offset = last_day.timetuple().tm_yday - 1
+        if first_day.year == last_day.year:
+            return self._sum(first_day.year, first_offset, last_offset) / days
+
+        year_days = 366 if calendar.isleap(first_day.year) else 365
+        total = self._sum(first_day.year, first_offset, year_days - 1) + self._sum(last_day.year, 0, last_offset)
+        # Полные годы между ними
+        full_years = last_day.year - first_day.year - 1
+        if full_years:
+            leap_years = calendar.leapdays(first_day.year + 1, last_day.year)
+            total += leap_years * self.cumsum[True][-1] + (full_years - leap_years) * self.cumsum[False][-1]
+        return float(total) / days
+
+
+def season_multiplier(day, seasons):
+    key = (day.month, day.day)
+    for start, end, multiplier in seasons:
+        inside = tuple(start) <= key <= tuple(end) if tuple(start) <= tuple(end) else (
+            key >= tuple(start) or key <= tuple(end)
+        )
+        if inside:
+            return float(multiplier)
+    return 1.0
+
+
+_season_table = None
+
+
+def mean_season_multiplier(first_day, days):
+    global _season_table
+    seasons = settings.PRICING_SEASONS
+    if _season_table is None or _season_table.seasons != seasons:
+        _season_table = SeasonTable(seasons)
+    return _season_table.mean(first_day, days)
+
+
+def long_rental_discount(days):
+    discounts = sorted(settings.PRICING_LONG_RENTAL_DISCOUNTS, key=lambda item: item[0], reverse=True)
+    for threshold, discount in discounts:
+        if days >= threshold:
+            return Decimal(discount)
+    return Decimal('0')
+
+
+class Rates:
+    """Ставки машины без модели: всё, что нужно quote_many()."""
+    __slots__ = ('pk', 'price_per_day', 'price_per_hour')
+
+    def __init__(self, pk, price_per_day, price_per_hour):
+        self.pk = pk
+        self.price_per_day = price_per_day
+        self.price_per_hour = price_per_hour
+
+
+def _rates_key(car_pk):
+    return f'pricing:rates:{car_pk}'
+
+
+# Наибольший pk (BigAutoField); больший id из URL в базу не отправляем
+MAX_PK = 2 ** 63 - 1
+
+
+def get_rates(car_pk):
+    """
+    Ставки доступной для брони машины или None. Кешируются только
+    найденные машины: id приходит от клиента, и кеш промахов позволил бы
+    забить кеш вечными пустыми записями.
+    """
+    if not isinstance(car_pk, int) or isinstance(car_pk, bool) or not 0 < car_pk <= MAX_PK:
+        return None
+    key = _rates_key(car_pk)
+    row = cache.get(key)
+    metrics.cache_lookup('pricing', row is not None)
+    if row is None:
+        row = Car.objects.filter(pk=car_pk, available=True).values_list(
+            'pk', 'price_per_day', 'price_per_hour'
+        ).first()
+        if row is None:
+            return None
+        cache.set(key, row, None)
+    return Rates(*row)
+
+
+def invalidate_rates(*car_pks):
+    cache.delete_many([_rates_key(pk) for pk in car_pks])
+
+
+def _cents(amount):
+    return int((Decimal(str(amount)) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def _apply_rate(cents, rate):
+    """cents * rate, где rate в десятитысячных долях; половина копейки - вверх."""
+    return (cents * rate + 5000) // 10000
+
+
+def _money(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+class Quote:
+    def __init__(self, car_id, hours, days, tier, base, season, discount, extras, total):
+        self.car_id = car_id
+        self.hours = hours
+        self.days = days
+        self.tier = tier
+        self.base = base
+        self.season = season
+        self.discount = discount
+        self.extras = extras
+        self.total = total
+
+    def as_dict(self):
+        return {
+            'car_id': self.car_id,
+            'hours': self.hours,
+            'days': self.days,
+            'tier': self.tier,
+            'base': str(self.base),
+            'season_multiplier': self.season,
+            'discount': str(self.discount),
+            'extras': {name: str(price) for name, price in self.extras.items()},
+            'total': str(self.total),
+            'currency': CURRENCY,
+        }
+
+
+def quote_many(cars, start, end, extras=()):
+    """Цены для списка машин на один период; возвращает {car.pk: Quote}."""
+    cars = list(cars)
+    if not cars:
+        return {}
+    hours, days = billing_period(start, end)
+    season = round(mean_season_multiplier(timezone.localdate(start), days), 4)
+    season_rate = round(season * 10000)
+    discount_rate = int(long_rental_discount(days) * 10000)
+
+    per_day = np.array([_cents(car.price_per_day) for car in cars], dtype=np.int64)
+    has_hourly = np.array([car.price_per_hour is not None for car in cars])
+    per_hour = np.array([
+        _cents(car.price_per_hour) if car.price_per_hour is not None else 0 for car in cars
+    ], dtype=np.int64)
+
+    weeks, rest = divmod(days, 7)
+    week_price_in_days = settings.PRICING_WEEK_PRICE_IN_DAYS
+    daily = (weeks * week_price_in_days + min(rest, week_price_in_days)) * per_day
+    hourly = np.minimum(hours * per_hour, per_day)
+    use_hourly = (hours < 24) & has_hourly
+    base = _apply_rate(np.where(use_hourly, hourly, daily), season_rate)
+    discount = _apply_rate(base, discount_rate)
+
+    extra_cents = {name: _cents(EXTRAS[name]['per_day']) * days for name in extras}
+    total = base - discount + sum(extra_cents.values())
+
+    return {
+        car.pk: Quote(
+            car_id=car.pk,
+            hours=hours,
+            days=days,
+            tier='hourly' if use_hourly[i] else ('weekly' if weeks else 'daily'),
+            base=_money(base[i]),
+            season=season,
+            discount=_money(discount[i]),
+            extras={name: _money(cents) for name, cents in extra_cents.items()},
+            total=_money(total[i]),
+        )
+        for i, car in enumerate(cars)
+    }
+
+
+def quote(car, start, end, extras=()):
+    return quote_many([car], start, end, extras)[car.pk]
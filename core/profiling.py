@@ -0,0 +1,159 @@
+"""
+Профилирование запросов: SQL, шаблоны и код представления.
+
+ProfilingMiddleware для каждого запроса считает число и суммарное
+время SQL (по всем базам, через execute_wrapper), время рендера
+шаблонов и остальное время (код представления и middleware) - это
+несколько вызовов perf_counter и список SQL без параметров. Для доли
+запросов PROFILING_SAMPLE_RATE итог уходит в заголовок Server-Timing
+(виден во вкладке Network браузера) и одной JSON-строкой в лог
+core.profiling. Любой запрос дольше PROFILING_SLOW_REQUEST_MS, попал
+он в выборку или нет, пишется в лог вместе с полным списком SQL.
+Параметры запросов не логируются.
+
+Время шаблонов замеряется подменой Template.render на весь процесс,
+поэтому подмена ставится, только если PROFILING_SAMPLE_RATE больше 0;
+при одном пороге медленных запросов время шаблонов входит в время
+представления (template_ms в логе - null). Время SQL, выполненного во
+время рендера (ленивые queryset в шаблоне), считается как SQL, а не
+как шаблон. Если и PROFILING_SAMPLE_RATE, и PROFILING_SLOW_REQUEST_MS
+равны 0 (по умолчанию), middleware отключается при старте и ничего не
+стоит.
+"""
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    __slots__ = ('queries', 'render_time', 'render_sql_time', 'render_depth')
+
+    def __init__(self):
+        self.queries = []  # (секунды, база, sql)
+        self.render_time = 0.0
+        self.render_sql_time = 0.0
+        self.render_depth = 0
+
+    @property
+    def sql_time(self):
+        return sum(duration for duration, _, _ in self.queries)
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries.append((duration, context['connection'].alias, sql))
+            if self.render_depth:
+                self.render_sql_time += duration
+
+
+def _profiled_render(render):
+    @wraps(render)
+    def wrapper(self, context=None, request=None):
+        profile = _current.get()
+        # Вложенные рендеры (фрагменты карточек) уже внутри внешнего
+        if profile is None or profile.render_depth:
+            return render(self, context, request)
+        profile.render_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            profile.render_time += time.perf_counter() - start
+            profile.render_depth -= 1
+    wrapper.profiled = True
+    return wrapper
+
+
+def install_template_timer():
+    if not getattr(Template.render, 'profiled', False):
+        Template.render = _profiled_render(Template.render)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if settings.PROFILING_SAMPLE_RATE <= 0 and settings.PROFILING_SLOW_REQUEST_MS <= 0:
+            raise MiddlewareNotUsed
+        self.time_templates = settings.PROFILING_SAMPLE_RATE > 0
+        if self.time_templates:
+            install_template_timer()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = random.random() < settings.PROFILING_SAMPLE_RATE
+        profile = RequestProfile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.record_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+        slow = 0 < settings.PROFILING_SLOW_REQUEST_MS <= _ms(total)
+        if not sampled and not slow:
+            return response
+
+        sql = profile.sql_time
+        render = profile.render_time - profile.render_sql_time if self.time_templates else None
+        view = max(0.0, total - sql - (render or 0.0))
+        # Заголовок должен быть в latin-1, поэтому описания по-английски
+        if sampled:
+            response['Server-Timing'] = ', '.join([
+                f'sql;dur={_ms(sql)};desc="SQL ({len(profile.queries)})"',
+                f'tpl;dur={_ms(render)};desc="Templates"',
+                f'view;dur={_ms(view)};desc="View"',
+                f'total;dur={_ms(total)}',
+            ])
+        self.log(request, response, profile, total, sql, render, view, slow)
+        return response
+
+    def log(self, request, response, profile, total, sql, render, view, slow):
+        match = request.resolver_match
+        slowest = sorted(profile.queries, key=lambda query: query[0], reverse=True)
+        entry = {
+            'event': 'request_profile',
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': _ms(total),
+            'view_ms': _ms(view),
+            'template_ms': None if render is None else _ms(render),
+            'sql_ms': _ms(sql),
+            'queries': len(profile.queries),
+            'slowest': [
+                {'ms': _ms(duration), 'db': alias, 'sql': sql_text[:300]}
+                for duration, alias, sql_text in slowest[:settings.PROFILING_SLOWEST_QUERIES]
+            ],
+        }
+        if not slow:
+            logger.info(json.dumps(entry, ensure_ascii=False))
+            return
+        entry['event'] = 'slow_request'
+        entry['all_queries'] = [
+            {'ms': _ms(duration), 'db': alias, 'sql': sql_text}
+            for duration, alias, sql_text in profile.queries
+        ]
+        logger.warning(json.dumps(entry, ensure_ascii=False))
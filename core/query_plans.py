@@ -0,0 +1,127 @@
+"""
+Проверка планов горячих запросов.
+
+hot_queries() строит запросы главной, моих заказов и избранного теми же
+функциями, что и представления (CarSearchForm.filter_cars(),
+catalogue.sort_cars(), выборки и пагинатор из core.views), так что
+изменение представления сразу попадает в проверку; к ним добавлены
+запросы страницы машины и add_review. assert_uses_index() смотрит EXPLAIN и бросает
+IndexNotUsed (подкласс AssertionError), если таблица читается полным
+проходом или результат сортируется отдельно, а не берётся в порядке
+индекса. На PostgreSQL полный проход перед EXPLAIN запрещается
+(enable_seqscan = off): на маленькой таблице планировщик честно выбрал
+бы его, а проверить нужно, что подходящий индекс вообще есть.
+Проверка - QueryPlanTests в core/tests.py (manage.py test).
+"""
+import datetime
+import re
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import views
+from .catalogue import ORDERINGS, sort_cars
+from .forms import CarSearchForm
+from .models import Car, Order, Review
+from .pagination import CursorPaginator, get_paginator
+
+# Фильтры главной, которые должны идти по индексу сортировки. Поиск не
+# проверяется: его выдача соединяется с таблицей полнотекстового индекса
+HOME_FILTERS = {
+    'all': {},
+    'brand': {'brand': 'BMW'},
+    'price': {'min_price': 500, 'max_price': 1500},
+    'fuel_transmission': {'fuel_type': 'petrol', 'transmission': 'automatic'},
+    'seats': {'seats': 5},
+    'dates': {'start_date': 7, 'end_date': 10},  # дни от сегодня
+}
+
+
+class IndexNotUsed(AssertionError):
+    pass
+
+
+def _sqlite_problems(plan):
+    problems = []
+    for line in plan.splitlines():
+        if re.search(r'\bSCAN \w+', line) and 'USING' not in line:
+            problems.append(line.strip())
+        elif 'USE TEMP B-TREE FOR ORDER BY' in line:
+            problems.append(line.strip())
+    return problems
+
+
+def _postgres_problems(plan):
+    return [
+        line.strip() for line in plan.splitlines()
+        if 'Seq Scan' in line or re.search(r'(^|->)\s*Sort\b', line.strip())
+    ]
+
+
+def explain(queryset):
+    if connection.vendor == 'postgresql':
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
+    return queryset.explain()
+
+
+def assert_uses_index(queryset, label=''):
+    plan = explain(queryset)
+    if connection.vendor == 'postgresql':
+        problems = _postgres_problems(plan)
+    elif connection.vendor == 'sqlite':
+        problems = _sqlite_problems(plan)
+    else:
+        return plan
+    if problems:
+        raise IndexNotUsed(f'{label or "Запрос"}: {"; ".join(problems)}\n{plan}')
+    return plan
+
+
+def first_page(queryset, per_page, view_name, ordering):
+    """Запрос первой страницы через тот же пагинатор, что у представления."""
+    paginator = get_paginator(queryset, per_page, view_name, ordering)
+    if isinstance(paginator, CursorPaginator):
+        return paginator.page_queryset()
+    return paginator.object_list[:per_page]
+
+
+def home_queries():
+    today = timezone.localdate()
+    queries = {}
+    for filter_name, data in HOME_FILTERS.items():
+        if filter_name == 'dates':
+            data = {key: today + datetime.timedelta(days=days) for key, days in data.items()}
+        form = CarSearchForm(data)
+        if not form.is_valid():
+            raise ValueError(f'{filter_name}: {form.errors.as_text()}')
+        cars = form.filter_cars(Car.objects.filter(available=True))
+        for sort in ORDERINGS:
+            # Диапазон цены с другой сортировкой - поиск по индексу цены и сортировка
+            # найденного; планировщик выбирает это и на больших данных
+            if filter_name == 'price' and not sort.startswith('price'):
+                continue
+            queryset, ordering = sort_cars(cars, sort, form.search_backend)
+            queries[f'home:{sort}:{filter_name}'] = first_page(queryset, views.HOME_PAGE_SIZE, 'home', ordering)
+    return queries
+
+
+def hot_queries(user, car):
+    """Имя -> queryset в том виде, в каком его строят представления."""
+    queries = home_queries()
+    queries.update({
+        'car_detail:reviews': Review.objects.filter(car=car).order_by('-created_at')[:5],
+        'car_detail:similar': Car.objects.filter(brand=car.brand, available=True).exclude(pk=car.pk)[:4],
+        'my_orders': first_page(
+            views.my_orders_queryset(user), views.ORDERS_PAGE_SIZE, 'my_orders', views.USER_LIST_ORDERING,
+        ),
+        # .exists() в add_review: без сортировки, LIMIT 1
+        'add_review:has_rented': Order.objects.filter(
+            user=user, car=car, status__in=['completed', 'active'],
+        ).order_by()[:1],
+        'my_favorites': first_page(
+            views.my_favorites_queryset(user), views.FAVORITES_PAGE_SIZE, 'my_favorites', views.USER_LIST_ORDERING,
+        ),
+    })
+    return queries
@@ -0,0 +1,49 @@
+"""
+Инкрементальный рейтинг автомобиля.
+
+Car хранит сумму оценок и число отзывов; при создании, изменении и
+удалении Review они сдвигаются атомарным UPDATE с F()-выражениями,
+который трогает только колонки рейтинга (updated_at не меняется, ETag
+API учитывает сами счётчики, см. core.api). Расхождения
+(массовые операции в обход сигналов) чинит manage.py reconcile_ratings.
+"""
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast, Round
+
+from .models import Car
+
+
+def apply_delta(car_id, sum_delta, count_delta):
+    if not sum_delta and not count_delta:
+        return
+    new_sum = F('rating_sum') + sum_delta
+    new_count = F('reviews_count') + count_delta
+    # В UPDATE F() ссылается на старые значения, поэтому рейтинг считается от new_*
+    rating = Case(
+        When(reviews_count__gt=-count_delta, then=Round(Cast(new_sum, FloatField()) / new_count, 2)),
+        default=Value(0.0),
+    )
+    Car.objects.filter(pk=car_id).update(rating_sum=new_sum, reviews_count=new_count, rating=rating)
+
+
+def remember_state(review):
+    review._rating_state = (review.car_id, review.rating) if review.pk else None
+
+
+def review_saved(review, created):
+    previous = None if created else getattr(review, '_rating_state', None)
+    if previous is None:
+        apply_delta(review.car_id, review.rating, 1)
+    else:
+        old_car_id, old_rating = previous
+        if old_car_id != review.car_id:
+            apply_delta(old_car_id, -old_rating, -1)
+            apply_delta(review.car_id, review.rating, 1)
+        else:
+            apply_delta(review.car_id, review.rating - old_rating, 0)
+    remember_state(review)
+
+
+def review_deleted(review):
+    car_id, rating = getattr(review, '_rating_state', None) or (review.car_id, review.rating)
+    apply_delta(car_id, -rating, -1)
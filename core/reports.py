@@ -0,0 +1,129 @@
+"""
+Выгрузка заказов в CSV для бухгалтерии.
+
+Строки читаются values_list() с join пользователя и машины через
+.iterator(chunk_size=...) (на PostgreSQL - серверный курсор) и сразу
+пишутся в ответ или файл, так что в памяти одновременно только одна
+пачка. Одни и те же колонки и фильтры использует действие в админке
+заказов, отчёт /reports/orders.csv и manage.py export_orders.
+"""
+import csv
+import datetime
+import re
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Order
+
+CHUNK_SIZE = 2000
+
+# Начало, с которого Excel читает ячейку как формулу
+FORMULA_PREFIXES = ('=', '@', '\t', '\r')
+# Число или телефон со знаком (+7 (999) 123-45-67, -1500.50): формулой не станет, не экранируем
+SIGNED_NUMBER = re.compile(r'[+-][\d ().-]*\d[\d ().-]*')
+
+# (заголовок, поле для values_list)
+ORDER_COLUMNS = (
+    ('Заказ', 'id'),
+    ('Создан', 'created_at'),
+    ('Статус', 'status'),
+    ('Пользователь', 'user__username'),
+    ('Имя', 'user__first_name'),
+    ('Фамилия', 'user__last_name'),
+    ('Автомобиль', 'car__name'),
+    ('Марка', 'car__brand'),
+    ('Модель', 'car__model'),
+    ('Год', 'car__year'),
+    ('Начало', 'start_date'),
+    ('Окончание', 'end_date'),
+    ('Место получения', 'pickup_location'),
+    ('Место возврата', 'return_location'),
+    ('Детское кресло', 'child_seat'),
+    ('Доп. водитель', 'additional_driver'),
+    ('Страховка', 'insurance'),
+    ('Телефон', 'phone'),
+    ('Email', 'email'),
+    ('Сумма', 'total_price'),
+)
+
+STATUS_LABELS = dict(Order.STATUS_CHOICES)
+
+
+def parse_moment(value, end_of_day=False):
+    """Дата или дата-время из параметра; дата без времени - начало (или конец) дня."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Неверная дата: {value}')
+        moment = datetime.datetime.combine(day, datetime.time.max if end_of_day else datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_orders(queryset, since=None, until=None, status=None):
+    """Заказы, созданные в [since, until], с нужным статусом."""
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+    if until is not None:
+        queryset = queryset.filter(created_at__lte=until)
+    if status:
+        queryset = queryset.filter(status=status)
+    return queryset
+
+
+def _cell(value):
+    if isinstance(value, bool):
+        return 'да' if value else 'нет'
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, str) and (
+        value.startswith(FORMULA_PREFIXES)
+        or (value[:1] in ('+', '-') and not SIGNED_NUMBER.fullmatch(value))
+    ):
+        # Поля, которые вводит клиент, не должны исполняться как формулы в Excel
+        return f"'{value}"
+    return value
+
+
+def order_rows(queryset, chunk_size=CHUNK_SIZE):
+    """Строки CSV (с заголовком) для заказов, пачками по chunk_size."""
+    yield [header for header, _ in ORDER_COLUMNS]
+    fields = [field for _, field in ORDER_COLUMNS]
+    status_index = fields.index('status')
+    rows = queryset.order_by('created_at', 'id').values_list(*fields)
+    for row in rows.iterator(chunk_size=chunk_size):
+        row = [_cell(value) for value in row]
+        row[status_index] = STATUS_LABELS.get(row[status_index], row[status_index])
+        yield row
+
+
+class Echo:
+    """Псевдофайл для csv.writer: write() возвращает строку, а не пишет её."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    # BOM, чтобы Excel открыл кириллицу в UTF-8
+    yield '\ufeff'
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_csv(rows, stream):
+    writer = csv.writer(stream)
+    for row in rows:
+        writer.writerow(row)
+
+
+def orders_csv_response(queryset, filename=None):
+    filename = filename or f'orders-{timezone.localdate():%Y-%m-%d}.csv'
+    response = StreamingHttpResponse(csv_lines(order_rows(queryset)), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,184 @@
+"""
+Полнотекстовый поиск по каталогу.
+
+Индекс хранится в отдельной таблице, ключом служит id автомобиля:
+на SQLite это виртуальная таблица FTS5 core_car_fts, на PostgreSQL -
+core_car_search с колонкой tsvector и GIN-индексом. Таблицы создаёт
+миграция 0004, строки обновляются сигналами Car (core.signals).
+Марка и модель весят больше названия, описание - меньше всего;
+каждое слово запроса ищется по префиксу.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Car
+
+
+INDEXED_FIELDS = frozenset({'name', 'brand', 'model', 'description'})
+# Сколько id передавать в одном запросе index_many (лимит параметров SQLite)
+INDEX_BATCH_SIZE = 500
+
+
+def _batched(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), INDEX_BATCH_SIZE):
+        yield ids[i:i + INDEX_BATCH_SIZE]
+
+
+def tokenize(query):
+    return re.findall(r'\w+', query.lower())
+
+
+class LikeSearchBackend:
+    """Запасной вариант для СУБД без полнотекстового индекса."""
+
+    ranked = False
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(name__icontains=query) |
+            Q(brand__icontains=query) |
+            Q(model__icontains=query) |
+            Q(description__icontains=query)
+        )
+
+    def index(self, car):
+        pass
+
+    def remove(self, car_pk):
+        pass
+
+    def index_many(self, car_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class SQLiteSearchBackend:
+    ranked = True
+    table = 'core_car_fts'
+    # Веса колонок для bm25 в порядке name, brand, model, description
+    weights = '5.0, 10.0, 10.0, 1.0'
+
+    def match_expression(self, tokens):
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none().annotate(search_rank=Value(0.0))
+        match = self.match_expression(tokens)
+        # Отбор - один MATCH на весь запрос; ранг считается по rowid только для
+        # найденных строк. bm25 отрицателен, чем меньше - тем релевантнее
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [match]),
+        ).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({self.table}, {self.weights}) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = {Car._meta.db_table}.id',
+            [match], output_field=FloatField(),
+        ))
+
+    def index(self, car):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [car.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, brand, model, description) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [car.pk, car.name, car.brand, car.model, car.description],
+            )
+
+    def remove(self, car_pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [car_pk])
+
+    def index_many(self, car_ids):
+        for batch in _batched(car_ids):
+            placeholders = ', '.join(['%s'] * len(batch))
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', batch)
+                cursor.execute(
+                    f'INSERT INTO {self.table} (rowid, name, brand, model, description) '
+                    f'SELECT id, name, brand, model, description FROM {Car._meta.db_table} '
+                    f'WHERE id IN ({placeholders})',
+                    batch,
+                )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, brand, model, description) '
+                f'SELECT id, name, brand, model, description FROM {Car._meta.db_table}'
+            )
+
+
+class PostgresSearchBackend:
+    ranked = True
+    table = 'core_car_search'
+    document_sql = (
+        "setweight(to_tsvector('simple', coalesce(brand, '') || ' ' || coalesce(model, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(name, '')), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'D')"
+    )
+
+    def tsquery(self, tokens):
+        return ' & '.join(f'{token}:*' for token in tokens)
+
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none().annotate(search_rank=Value(0.0))
+        tsquery = self.tsquery(tokens)
+        # Отбор идёт по GIN-индексу, ранг - по первичному ключу core_car_search
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT car_id FROM {self.table} WHERE document @@ to_tsquery('simple', %s)", [tsquery],
+        )).annotate(search_rank=RawSQL(
+            f"SELECT ts_rank(document, to_tsquery('simple', %s)) FROM {self.table} "
+            f'WHERE car_id = {Car._meta.db_table}.id',
+            [tsquery], output_field=FloatField(),
+        ))
+
+    def index(self, car):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.table} (car_id, document) '
+                f'SELECT id, {self.document_sql} FROM {Car._meta.db_table} WHERE id = %s '
+                f'ON CONFLICT (car_id) DO UPDATE SET document = EXCLUDED.document',
+                [car.pk],
+            )
+
+    def remove(self, car_pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE car_id = %s', [car_pk])
+
+    def index_many(self, car_ids):
+        for batch in _batched(car_ids):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {self.table} (car_id, document) '
+                    f'SELECT id, {self.document_sql} FROM {Car._meta.db_table} WHERE id = ANY(%s) '
+                    f'ON CONFLICT (car_id) DO UPDATE SET document = EXCLUDED.document',
+                    [batch],
+                )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (car_id, document) '
+                f'SELECT id, {self.document_sql} FROM {Car._meta.db_table}'
+            )
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, LikeSearchBackend)()
@@ -0,0 +1,107 @@
+from django.contrib.auth.signals import user_logged_in, user_logged_out, user_login_failed
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Car, CarCategory, Favorite, Order, Review, UserProfile
+from . import catalogue, favorites, fragments, images, metrics, occupancy, page_cache, pricing, ratings, search, suggest
+
+
+# Календарь занятости обновляется в транзакции заказа, а не воркером: без
+# запущенного run_workers фильтр по датам показывал бы занятые машины свободными
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, **kwargs):
+    occupancy.refresh_order(instance)
+    page_cache.purge(page_cache.OCCUPANCY)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    occupancy.clear_order(instance.pk)
+    page_cache.purge(page_cache.OCCUPANCY)
+
+
+@receiver(pre_save, sender=Car)
+def car_saving(sender, instance, **kwargs):
+    # updated_at ещё старый - удаляем фрагменты прежней версии
+    if instance.pk:
+        fragments.invalidate(instance)
+
+
+@receiver(post_save, sender=Car)
+def car_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or not search.INDEXED_FIELDS.isdisjoint(update_fields):
+        search.get_backend().index(instance)
+    suggest.invalidate()
+    page_cache.purge(page_cache.CATALOGUE, page_cache.car_tag(instance.pk))
+    catalogue.invalidate()
+    pricing.invalidate_rates(instance.pk)
+    images.schedule(instance, update_fields)
+
+
+@receiver(post_delete, sender=Car)
+def car_deleted(sender, instance, **kwargs):
+    search.get_backend().remove(instance.pk)
+    suggest.invalidate()
+    fragments.invalidate(instance)
+    page_cache.purge(page_cache.CATALOGUE, page_cache.car_tag(instance.pk))
+    catalogue.invalidate()
+    pricing.invalidate_rates(instance.pk)
+
+
+@receiver(post_init, sender=Review)
+def review_initialized(sender, instance, **kwargs):
+    ratings.remember_state(instance)
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    ratings.review_saved(instance, created)
+    page_cache.purge(page_cache.CATALOGUE, page_cache.car_tag(instance.car_id))
+    catalogue.invalidate()
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    ratings.review_deleted(instance)
+    page_cache.purge(page_cache.CATALOGUE, page_cache.car_tag(instance.car_id))
+    catalogue.invalidate()
+
+
+@receiver(post_save, sender=CarCategory)
+@receiver(post_delete, sender=CarCategory)
+def category_changed(sender, instance, **kwargs):
+    page_cache.purge(page_cache.CATALOGUE)
+    catalogue.invalidate()
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, created, **kwargs):
+    if created:
+        favorites.apply_delta([instance.car_id], 1)
+    favorites.invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    favorites.apply_delta([instance.car_id], -1)
+    favorites.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_saved(sender, instance, update_fields=None, **kwargs):
+    images.schedule(instance, update_fields)
+
+
+@receiver(user_logged_in)
+def user_logged_in_metric(sender, **kwargs):
+    metrics.AUTH_EVENTS.inc(event='login')
+
+
+@receiver(user_login_failed)
+def user_login_failed_metric(sender, **kwargs):
+    metrics.AUTH_EVENTS.inc(event='login_failed')
+
+
+@receiver(user_logged_out)
+def user_logged_out_metric(sender, **kwargs):
+    metrics.AUTH_EVENTS.inc(event='logout')
@@ -0,0 +1,95 @@
+"""
+Подсказки для поиска по марке, модели и названию.
+
+Индекс - отсортированный массив ключей в памяти процесса, поиск префикса
+идёт бинарным поиском, так что на тёплом пути база не нужна. Индекс
+строится при первом обращении и перестраивается, когда меняется
+поколение в кеше: его меняют сигналы Car (core.signals), поэтому
+при общем кеше (Redis и т.п.) сбрасываются индексы всех воркеров.
+
+Кеш в памяти процесса (locmem, по умолчанию без REDIS_URL) сигналы
+других воркеров не видит, поэтому с ним поколение дополняется версией
+из базы - числом машин и последним updated_at, которые проверяются не
+чаще раза в SUGGEST_DB_CHECK_INTERVAL секунд.
+"""
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from . import db_routing
+from .catalogue import cache_is_local
+from .models import Car
+
+GENERATION_KEY = 'suggest:generation'
+
+
+class SuggestIndex:
+    def __init__(self, rows):
+        entries = {}
+        for name, brand, model in rows:
+            full_model = f'{brand} {model}'
+            for key, value, kind in (
+                (brand, brand, 'brand'),
+                (model, full_model, 'model'),
+                (full_model, full_model, 'model'),
+                (name, name, 'name'),
+            ):
+                if key:
+                    entries.setdefault((key.lower(), value), kind)
+        items = sorted(entries.items())
+        self.keys = [key for (key, _), _ in items]
+        self.entries = [{'value': value, 'kind': kind} for (_, value), kind in items]
+
+    def lookup(self, prefix, limit=10):
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        i = bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix) and len(results) < limit:
+            entry = self.entries[i]
+            if entry['value'] not in seen:
+                seen.add(entry['value'])
+                results.append(entry)
+            i += 1
+        return results
+
+
+_index = None
+_generation = None
+_db_version = None
+_db_checked_at = None
+
+
+def _database_version():
+    global _db_version, _db_checked_at
+    now = time.monotonic()
+    if _db_checked_at is None or now - _db_checked_at >= settings.SUGGEST_DB_CHECK_INTERVAL:
+        version = Car.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+        _db_version = (version['count'], version['updated'])
+        _db_checked_at = now
+    return _db_version
+
+
+def get_index():
+    global _index, _generation
+    generation = cache.get(GENERATION_KEY)
+    if cache_is_local():
+        generation = (generation, _database_version())
+    if _index is None or generation != _generation:
+        with db_routing.use_primary():
+            _index = SuggestIndex(Car.objects.filter(available=True).values_list('name', 'brand', 'model'))
+        _generation = generation
+    return _index
+
+
+def invalidate():
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def suggest(prefix, limit=10):
+    return get_index().lookup(prefix, limit)
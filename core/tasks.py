@@ -0,0 +1,30 @@
+"""Обработчики фоновых задач (core.jobs)."""
+from django.core.mail import mail_admins, send_mail
+from django.template.loader import render_to_string
+
+from .jobs import task
+from .models import Order
+
+
+@task('send_booking_confirmation')
+def send_booking_confirmation(order_id):
+    order = Order.objects.select_related('car', 'user').filter(pk=order_id).first()
+    if order is None or not order.email:
+        return
+    send_mail(
+        f'Заказ #{order.id} оформлен',
+        render_to_string('core/emails/booking_confirmation.txt', {'order': order}),
+        None,
+        [order.email],
+    )
+
+
+@task('notify_admins_new_order')
+def notify_admins_new_order(order_id):
+    order = Order.objects.select_related('car', 'user').filter(pk=order_id).first()
+    if order is None:
+        return
+    mail_admins(
+        f'Новый заказ #{order.id}',
+        render_to_string('core/emails/new_order_admin.txt', {'order': order}),
+    )
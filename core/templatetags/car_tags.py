@@ -0,0 +1,30 @@
+from django import template
+from django.template.loader import render_to_string
+
+from core import fragments, images
+
+register = template.Library()
+
+
+@register.simple_tag
+def car_image(car, variant='card', width=None):
+    return fragments.render_image(car, variant, width)
+
+
+@register.simple_tag
+def car_card_body(car, variant='grid'):
+    return fragments.render_body(car, variant)
+
+
+@register.simple_tag
+def responsive_image(image, width, css_class='', alt='', style=''):
+    """<picture> с превью из core.images для любого ImageField; без превью - просто <img>."""
+    width = images.snap_width(width)
+    return render_to_string('core/includes/picture.html', {
+        'src': image.url,
+        'sources': images.sources(image.name, width),
+        'width': width,
+        'css_class': css_class,
+        'alt': alt,
+        'style': style,
+    })
@@ -0,0 +1,442 @@
+import datetime
+import io
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import catalogue, favorites, fleet, jobs, pricing, reports, search
+from .availability import CarUnavailable, reserve
+from .models import Car, Favorite, Job, Order, Review
+from .query_plans import assert_uses_index, hot_queries
+
+# Отдельный кеш в памяти: тесты не пишут фрагменты и снимки в общий Redis
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'}}
+
+
+def seed_catalogue(user, rows, prefix):
+    cars = Car.objects.bulk_create(
+        Car(name=f'{prefix} {i}', brand='BMW', model=f'{prefix}{i}', year=2020, price_per_day=1000,
+            slug=f'{prefix.lower()}-{i}')
+        for i in range(rows)
+    )
+    now = timezone.now()
+    Order.objects.bulk_create(
+        Order(user=user, car=car, start_date=now + datetime.timedelta(days=i * 3),
+              end_date=now + datetime.timedelta(days=i * 3 + 1), total_price=1000,
+              pickup_location='Центр', return_location='Центр')
+        for i, car in enumerate(cars)
+    )
+    Favorite.objects.bulk_create(Favorite(user=user, car=car) for car in cars)
+    reviewers = User.objects.bulk_create(User(username=f'{prefix.lower()}-{i}') for i in range(rows))
+    Review.objects.bulk_create(
+        Review(user=reviewer, car=cars[0], rating=5, comment='Отлично') for reviewer in reviewers
+    )
+    return cars
+
+
+@override_settings(CACHES=TEST_CACHES, PAGE_CACHE=None)
+class QueryCountTests(TestCase):
+    """
+    Число SQL-запросов на основных страницах (сессия и кеши процесса
+    прогреты). Число не должно расти вместе с данными - иначе это N+1.
+    """
+    QUERIES = {
+        'home': 4,
+        'car_detail': 5,
+        'my_orders': 3,
+        'my_favorites': 5,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('budget', first_name='Бюджет', last_name='Тест')
+        cls.cars = seed_catalogue(cls.user, 10, 'Budget')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.client.get(reverse('core:home'))
+
+    def urls(self):
+        car = self.cars[0]
+        return {
+            'home': reverse('core:home'),
+            'car_detail': reverse('core:car_detail', kwargs={'pk': car.pk, 'slug': car.slug}),
+            'my_orders': reverse('core:my_orders'),
+            'my_favorites': reverse('core:my_favorites'),
+        }
+
+    def assertPageQueries(self):
+        for name, url in self.urls().items():
+            with self.subTest(page=name), self.assertNumQueries(self.QUERIES[name]):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, name)
+
+    def test_page_queries(self):
+        self.assertPageQueries()
+
+    def test_page_queries_do_not_grow_with_rows(self):
+        seed_catalogue(self.user, 30, 'More')
+        self.assertPageQueries()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FavoriteToggleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('hearts')
+        cls.car = Car.objects.create(name='Heart', brand='Kia', model='Rio', year=2020, price_per_day=1000)
+
+    def setUp(self):
+        cache.clear()
+
+    def cached_ids(self):
+        return cache.get(favorites._cache_key(self.user.pk))
+
+    def test_cache_dropped_after_commit(self):
+        favorites.favorite_ids(self.user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(favorites.toggle(self.user, self.car.pk), (True, 1))
+            # До коммита параллельный запрос ещё видит старые строки - кеш не трогаем
+            self.assertEqual(self.cached_ids(), frozenset())
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(self.cached_ids())
+
+    def test_toggle_back(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            favorites.toggle(self.user, self.car.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(favorites.toggle(self.user, self.car.pk), (False, 0))
+        self.assertFalse(Favorite.objects.filter(user=self.user).exists())
+        self.car.refresh_from_db()
+        self.assertEqual(self.car.favorites_count, 0)
+
+
+@override_settings(CACHES=TEST_CACHES, PAGE_CACHE=None)
+class BookingTests(TestCase):
+    """Пересечение бронирований: конец одного заказа может совпадать с началом другого."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('booking', email='booking@example.com')
+        cls.car = Car.objects.create(name='Booking', brand='Kia', model='Rio', year=2020, price_per_day=1000)
+        cls.start = timezone.now().replace(microsecond=0) + datetime.timedelta(days=10)
+
+    def order(self, start_day, end_day, status='pending'):
+        return Order(
+            user=self.user, car=self.car, status=status, total_price=1000,
+            start_date=self.start + datetime.timedelta(days=start_day),
+            end_date=self.start + datetime.timedelta(days=end_day),
+            pickup_location='Центр', return_location='Центр',
+        )
+
+    def test_back_to_back_allowed(self):
+        reserve(self.order(0, 2))
+        reserve(self.order(2, 4))
+        reserve(self.order(-2, 0))
+        self.assertEqual(Order.objects.filter(car=self.car).count(), 3)
+
+    def test_overlap_rejected(self):
+        reserve(self.order(0, 2))
+        for start_day, end_day in [(1, 3), (-1, 1), (0, 2), (-1, 3)]:
+            with self.subTest(start=start_day, end=end_day), self.assertRaises(CarUnavailable):
+                reserve(self.order(start_day, end_day))
+        self.assertEqual(Order.objects.filter(car=self.car).count(), 1)
+
+    def test_overlap_form_error(self):
+        reserve(self.order(0, 2))
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('core:book_car', kwargs={'pk': self.car.pk}), {
+            'start_date': (self.start + datetime.timedelta(days=1)).strftime('%Y-%m-%dT%H:%M'),
+            'end_date': (self.start + datetime.timedelta(days=3)).strftime('%Y-%m-%dT%H:%M'),
+            'pickup_location': 'Центр', 'return_location': 'Центр',
+            'phone': '+7 999 123-45-67', 'email': 'booking@example.com',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(
+            response.context['form'], 'start_date', 'Автомобиль уже забронирован на выбранные даты.',
+        )
+        self.assertEqual(Order.objects.filter(car=self.car).count(), 1)
+
+    def test_cancelled_does_not_block(self):
+        order = reserve(self.order(0, 2))
+        order.status = 'cancelled'
+        order.save()
+        reserve(self.order(1, 3))
+        self.assertEqual(Order.objects.filter(car=self.car, status='pending').count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES, PRICING_MAX_DAYS=365)
+class PriceQuoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.car = Car.objects.create(name='Quote', brand='BMW', model='X1', year=2020, price_per_day=1000)
+
+    def quote(self, start, end):
+        return self.client.get(reverse('core:price_quote', kwargs={'car_pk': self.car.pk}), {'start': start, 'end': end})
+
+    def test_period_bounds(self):
+        for start, end, status in [
+            ('2026-07-01T10:00', '2027-07-01T10:00', 200),
+            ('2026-07-01T10:00', '2027-07-02T10:00', 400),
+            ('2026-07-01T10:00', '9998-12-30T10:00', 400),
+            ('0001-01-01T00:00', '0001-01-03T00:00', 200),
+            ('9999-12-30T00:00', '9999-12-31T12:00', 200),
+        ]:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(self.quote(start, end).status_code, status)
+
+    def test_unknown_car_is_not_cached(self):
+        for pk in (0, 10 ** 6, 2 ** 64):
+            with self.subTest(pk=pk):
+                response = self.client.get(
+                    reverse('core:price_quote', kwargs={'car_pk': pk}),
+                    {'start': '2026-07-01T10:00', 'end': '2026-07-02T10:00'},
+                )
+                self.assertEqual(response.status_code, 404)
+                self.assertIsNone(cache.get(pricing._rates_key(pk)))
+
+    def test_season_mean_across_years(self):
+        # 25.12-08.01 x1.3, остальная зима x1
+        response = self.quote('2026-12-20T10:00', '2027-01-09T10:00')
+        self.assertEqual(response.json()['season_multiplier'], round((5 + 15 * 1.3) / 20, 4))
+
+
+@override_settings(CACHES=TEST_CACHES, PAGE_CACHE=None)
+class ApiEtagTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('etag')
+        cls.car = Car.objects.create(name='Etag', brand='BMW', model='X3', year=2020, price_per_day=1000)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def etags(self):
+        return (
+            self.client.get(reverse('core:api_car_list'))['ETag'],
+            self.client.get(reverse('core:api_car_detail', kwargs={'pk': self.car.pk}))['ETag'],
+        )
+
+    def test_list_etag_without_queries(self):
+        etag = self.client.get(reverse('core:api_car_list'))['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('core:api_car_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_favorite_keeps_updated_at(self):
+        updated_at = self.car.updated_at
+        list_etag, detail_etag = self.etags()
+        self.client.post(reverse('core:toggle_favorite', kwargs={'car_pk': self.car.pk}))
+        self.car.refresh_from_db()
+        self.assertEqual(self.car.updated_at, updated_at)
+        self.assertEqual(self.car.favorites_count, 1)
+        new_list_etag, new_detail_etag = self.etags()
+        self.assertEqual(new_list_etag, list_etag)
+        self.assertNotEqual(new_detail_etag, detail_etag)
+
+    def test_review_changes_etags(self):
+        before = self.etags()
+        Review.objects.create(user=self.user, car=self.car, rating=4, comment='Хорошо')
+        self.car.refresh_from_db()
+        self.assertEqual((self.car.reviews_count, self.car.rating_sum), (1, 4))
+        after = self.etags()
+        self.assertNotEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+
+    def test_review_edit_changes_reviews_etag(self):
+        review = Review.objects.create(user=self.user, car=self.car, rating=4, comment='Хорошо')
+        url = reverse('core:api_car_reviews', kwargs={'pk': self.car.pk})
+        etag = self.client.get(url)['ETag']
+        review.rating, review.comment = 2, 'Уже хуже'
+        review.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['comment'], 'Уже хуже')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.x5 = Car.objects.create(name='BMW X5', brand='BMW', model='X5', year=2020, price_per_day=1000)
+        cls.mention = Car.objects.create(
+            name='Kia Rio', brand='Kia', model='Rio', year=2020, price_per_day=1000,
+            description='Как BMW, только дешевле',
+        )
+        Car.objects.create(name='Kia Ceed', brand='Kia', model='Ceed', year=2020, price_per_day=1000)
+
+    def test_relevance(self):
+        backend = search.get_backend()
+        cars = backend.search(Car.objects.all(), 'bmw')
+        if backend.ranked:
+            cars, _ = catalogue.sort_cars(cars, 'relevance', backend)
+        self.assertEqual(list(cars), [self.x5, self.mention])
+        self.assertEqual(list(backend.search(Car.objects.all(), 'bm x')), [self.x5])
+        self.assertFalse(backend.search(Car.objects.all(), '!!!').exists())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class QueryPlanTests(TestCase):
+    """Горячие запросы идут по индексам (core.query_plans)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('plans')
+        cls.cars = seed_catalogue(cls.user, 3, 'Plans')
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in hot_queries(self.user, self.cars[0]).items():
+            with self.subTest(query=name):
+                assert_uses_index(queryset, name)
+
+
+@override_settings(JOBS_EAGER=False, JOB_MAX_ATTEMPTS=3, JOB_RETRY_DELAY=10)
+class JobQueueTests(TestCase):
+    """Очередь задач: захват, повтор с задержкой, failed после max_attempts, ключ идемпотентности."""
+
+    def setUp(self):
+        self.calls = []
+        self.failures = 0
+        handlers = mock.patch.dict(jobs.HANDLERS, {'test_job': self.handler})
+        handlers.start()
+        self.addCleanup(handlers.stop)
+
+    def handler(self, value=None):
+        self.calls.append(value)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('сбой')
+
+    def make_ready(self, job):
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+
+    def test_claim(self):
+        job = jobs.enqueue('test_job', {'value': 1})
+        later = jobs.enqueue('test_job', {'value': 2}, delay=60)
+        claimed = jobs.claim('worker-1', limit=5)
+        self.assertEqual([j.pk for j in claimed], [job.pk])
+        self.assertEqual((claimed[0].status, claimed[0].attempts, claimed[0].locked_by), ('running', 1, 'worker-1'))
+        # Захваченную задачу второй воркер не получает
+        self.assertEqual(jobs.claim('worker-2', limit=5), [])
+        self.assertTrue(jobs.execute(claimed[0]))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(self.calls, [1])
+        later.refresh_from_db()
+        self.assertEqual(later.status, 'pending')
+
+    def test_retry_with_backoff(self):
+        self.failures = 2
+        job = jobs.enqueue('test_job')
+        for attempt, delay in [(1, 10), (2, 20)]:
+            with self.subTest(attempt=attempt):
+                before = timezone.now()
+                with self.assertLogs('core.jobs', 'WARNING'):
+                    self.assertEqual(jobs.work_once('worker'), 1)
+                job.refresh_from_db()
+                self.assertEqual((job.status, job.attempts), ('pending', attempt))
+                self.assertIn('сбой', job.last_error)
+                self.assertGreaterEqual(job.run_at, before + datetime.timedelta(seconds=delay * 0.75))
+                self.assertLessEqual(job.run_at, timezone.now() + datetime.timedelta(seconds=delay * 1.25))
+                # До run_at задачу никто не забирает
+                self.assertEqual(jobs.work_once('worker'), 0)
+                self.make_ready(job)
+        jobs.work_once('worker')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 3))
+
+    def test_failed_after_max_attempts(self):
+        self.failures = 10
+        job = jobs.enqueue('test_job')
+        for _ in range(3):
+            with self.assertLogs('core.jobs', 'WARNING'):
+                jobs.work_once('worker')
+            self.make_ready(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(jobs.work_once('worker'), 0)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_idempotency_key(self):
+        first = jobs.enqueue('test_job', {'value': 1}, key='test:1')
+        second = jobs.enqueue('test_job', {'value': 2}, key='test:1')
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(Job.objects.filter(idempotency_key='test:1').count(), 1)
+        jobs.work_once('worker')
+        self.assertEqual(self.calls, [1])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FleetImportTests(TestCase):
+    """Импорт парка (core.fleet, manage.py import_cars): upsert по external_id и раздача слагов."""
+
+    def rows(self, *specs):
+        return [
+            {'external_id': external_id, 'name': f'Kia Rio {external_id}', 'brand': 'Kia', 'model': 'Rio',
+             'year': '2020', 'price_per_day': price}
+            for external_id, price in specs
+        ]
+
+    def import_rows(self, rows):
+        with transaction.atomic():
+            return fleet.import_rows(rows, batch_size=2)
+
+    def test_upsert_by_external_id(self):
+        result = self.import_rows(self.rows(('A-1', '1000'), ('A-2', '2000')))
+        self.assertEqual((result.created, result.updated, result.unchanged), (2, 0, 0))
+        result = self.import_rows(self.rows(('A-1', '1000'), ('A-2', '2500'), ('A-3', '3000')))
+        self.assertEqual((result.created, result.updated, result.unchanged), (1, 1, 1))
+        self.assertEqual(Car.objects.count(), 3)
+        self.assertEqual(Car.objects.get(external_id='A-2').price_per_day, 2500)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8') as stream:
+            stream.write('external_id,name,brand,model,year,price_per_day\n')
+            stream.write('C-1,Kia Rio,Kia,Rio,2020,1000\n')
+            stream.flush()
+            call_command('import_cars', stream.name, stdout=io.StringIO())
+            Car.objects.filter(external_id='C-1').update(price_per_day=1)
+            output = io.StringIO()
+            call_command('import_cars', stream.name, stdout=output)
+        self.assertIn('новых 0, обновлено 1', output.getvalue())
+        self.assertEqual(Car.objects.get(external_id='C-1').price_per_day, 1000)
+        self.assertEqual(Car.objects.count(), 1)
+
+    def test_slug_collisions(self):
+        existing = Car.objects.create(name='Kia Rio', brand='Kia', model='Rio', year=2020, price_per_day=1000)
+        self.assertEqual(existing.slug, 'kia-rio-2020')
+        self.import_rows(self.rows(('B-1', '1000'), ('B-2', '1000'), ('B-3', '1000')))
+        self.assertEqual(
+            list(Car.objects.filter(external_id__isnull=False).order_by('external_id').values_list('slug', flat=True)),
+            ['kia-rio-2020-2', 'kia-rio-2020-3', 'kia-rio-2020-4'],
+        )
+        self.import_rows(self.rows(('B-4', '1000')))
+        self.assertEqual(Car.objects.get(external_id='B-4').slug, 'kia-rio-2020-5')
+
+
+class ReportCellTests(SimpleTestCase):
+    def test_formula_escaping(self):
+        for value, expected in [
+            ('=HYPERLINK("http://x")', '\'=HYPERLINK("http://x")'),
+            ('@SUM(A1)', "'@SUM(A1)"),
+            ('\t=1+1', "'\t=1+1"),
+            ('+cmd|"/c calc"!A1', '\'+cmd|"/c calc"!A1'),
+            ('-2+3', "'-2+3"),
+            ('+7 (999) 123-45-67', '+7 (999) 123-45-67'),
+            ('-1500.50', '-1500.50'),
+            ('-', "'-"),
+            ('Иван', 'Иван'),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(reports._cell(value), expected)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'core'
 
@@ -13,6 +13,17 @@ urlpatterns = [
     path('review/<int:car_pk>/', views.add_review, name='add_review'),
     path('toggle-favorite/<int:car_pk>/', views.toggle_favorite, name='toggle_favorite'),
     path('my-favorites/', views.my_favorites, name='my_favorites'),
+    path('api/suggest/', views.suggest, name='suggest'),
+    path('api/quote/<int:car_pk>/', views.price_quote, name='price_quote'),
+    path('api/favorites/', views.add_favorites, name='add_favorites'),
     path('register/', views.register, name='register'),
     path('profile/', views.profile, name='profile'),
+    path('reports/orders.csv', views.orders_report, name='orders_report'),
+    path('metrics', views.metrics_view, name='metrics'),
+    
+    # JSON API только для чтения (core.api)
+    path('api/v1/cars/', api.car_list, name='api_car_list'),
+    path('api/v1/cars/<int:pk>/', api.car_detail, name='api_car_detail'),
+    path('api/v1/cars/<int:pk>/reviews/', api.car_reviews, name='api_car_reviews'),
+    path('api/v1/categories/', api.categories, name='api_categories'),
 ]
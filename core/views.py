@@ -1,103 +1,121 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.core.paginator import Paginator
-from django.db.models import Q, Avg
-from decimal import Decimal
-from datetime import datetime, timedelta
-from .models import Car, Order, Review, Favorite, CarCategory, UserProfile
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
+import json
+import secrets
+from datetime import datetime, time, timedelta
+from .models import Car, Order, Review, Favorite, UserProfile
 from .forms import BookingForm, ReviewForm, UserRegistrationForm, UserProfileForm, CarSearchForm
+from .availability import reserve, CarUnavailable
+from . import suggest as suggest_index
+from .pagination import paginate
+from . import page_cache
+from . import catalogue
+from . import jobs
+from . import pricing
+from . import favorites as favorite_store
+from . import reports
+from . import metrics
+from .favorites import favorite_ids
 
 
+# Размеры страниц и выборки списков; их же проверяет по EXPLAIN core.query_plans
+HOME_PAGE_SIZE = 12
+ORDERS_PAGE_SIZE = 10
+FAVORITES_PAGE_SIZE = 12
+USER_LIST_ORDERING = ('-created_at', '-id')
+
+
+def my_orders_queryset(user):
+    return Order.objects.filter(user=user).select_related('car').defer('car__description')
+
+
+def my_favorites_queryset(user):
+    return Favorite.objects.filter(user=user).select_related('car').order_by(*USER_LIST_ORDERING)
+
+
+@page_cache.cache_anonymous_page(
+    'home', allowed_params=[*CarSearchForm.base_fields, 'sort', 'page', 'cursor']
+)
 def home(request):
     # Получаем параметры поиска
     form = CarSearchForm(request.GET)
     cars = Car.objects.filter(available=True)
+    search_backend = None
+    rental_period = None
     
     if form.is_valid():
-        search = form.cleaned_data.get('search')
-        brand = form.cleaned_data.get('brand')
-        min_price = form.cleaned_data.get('min_price')
-        max_price = form.cleaned_data.get('max_price')
-        fuel_type = form.cleaned_data.get('fuel_type')
-        transmission = form.cleaned_data.get('transmission')
-        seats = form.cleaned_data.get('seats')
+        cars = form.filter_cars(cars)
+        search_backend = form.search_backend
         
-        if search:
-            cars = cars.filter(
-                Q(name__icontains=search) |
-                Q(brand__icontains=search) |
-                Q(model__icontains=search) |
-                Q(description__icontains=search)
+        if form.rental_days:
+            page_cache.tag_request(request, page_cache.OCCUPANCY)
+            # Даты включительно: с начала первого дня до конца последнего
+            first_day, last_day = form.rental_days
+            rental_period = (
+                timezone.make_aware(datetime.combine(first_day, time.min)),
+                timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min)),
             )
-        
-        if brand:
-            cars = cars.filter(brand__icontains=brand)
-        
-        if min_price:
-            cars = cars.filter(price_per_day__gte=min_price)
-        
-        if max_price:
-            cars = cars.filter(price_per_day__lte=max_price)
-        
-        if fuel_type:
-            cars = cars.filter(fuel_type=fuel_type)
-        
-        if transmission:
-            cars = cars.filter(transmission=transmission)
-        
-        if seats:
-            cars = cars.filter(seats__gte=seats)
     
-    # Сортировка
-    sort_by = request.GET.get('sort', 'created_at')
-    if sort_by == 'price_asc':
-        cars = cars.order_by('price_per_day')
-    elif sort_by == 'price_desc':
-        cars = cars.order_by('-price_per_day')
-    elif sort_by == 'rating':
-        cars = cars.order_by('-rating')
-    elif sort_by == 'year':
-        cars = cars.order_by('-year')
-    else:
-        cars = cars.order_by('-created_at')
+    # Сортировка по умолчанию - по релевантности; без поиска она же "сначала новые".
+    # Поэтому первый поиск из формы (sort=relevance) сразу ранжируется
+    sort_by = request.GET.get('sort') or 'relevance'
+    cars, ordering = catalogue.sort_cars(cars, sort_by, search_backend)
     
     # Пагинация
-    paginator = Paginator(cars, 12)  # 12 автомобилей на страницу
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, cars, HOME_PAGE_SIZE, 'home', ordering)
+    
+    # Цена за выбранные даты для всех карточек страницы одним расчётом
+    if rental_period:
+        quotes = pricing.quote_many(page_obj, *rental_period)
+        for car in page_obj:
+            car.quote = quotes[car.pk]
     
     # Статистика для главной страницы
-    total_cars = Car.objects.filter(available=True).count()
-    categories = CarCategory.objects.all()
-    featured_cars = Car.objects.filter(available=True, rating__gte=4.0)[:3]
+    snapshot = catalogue.get_snapshot()
+    
+    # Параметры фильтра для ссылок пагинации
+    query_params = request.GET.copy()
+    query_params.pop('page', None)
+    query_params.pop('cursor', None)
     
     context = {
         'page_obj': page_obj,
         'form': form,
-        'total_cars': total_cars,
-        'categories': categories,
-        'featured_cars': featured_cars,
+        'query_string': query_params.urlencode(),
+        'total_cars': snapshot['total_cars'],
+        'categories': snapshot['categories'],
+        'featured_cars': snapshot['featured_cars'],
         'current_sort': sort_by,
     }
     return render(request, 'core/home.html', context)
 
 
+@page_cache.cache_anonymous_page('car_detail')
 def car_detail(request, pk, slug=None):
     car = get_object_or_404(Car, pk=pk)
-    reviews = car.car_reviews.all()[:5]  # Последние 5 отзывов
+    reviews = car.car_reviews.select_related('user').only(
+        'car_id', 'rating', 'comment', 'created_at',
+        'user__username', 'user__first_name', 'user__last_name',
+    )[:5]  # Последние 5 отзывов
     
     # Проверяем, добавлен ли автомобиль в избранное
-    is_favorite = False
-    if request.user.is_authenticated:
-        is_favorite = Favorite.objects.filter(user=request.user, car=car).exists()
+    is_favorite = car.pk in favorite_ids(request.user)
     
     # Похожие автомобили
     similar_cars = Car.objects.filter(
         brand=car.brand, available=True
     ).exclude(pk=car.pk)[:4]
+    page_cache.tag_request(request, page_cache.car_tag(car.pk), *(
+        page_cache.car_tag(similar.pk) for similar in similar_cars
+    ))
     
     context = {
         'car': car,
@@ -113,6 +131,7 @@ def book_car(request, pk):
     car = get_object_or_404(Car, pk=pk, available=True)
     
     if request.method == 'POST':
+        metrics.BOOKING_FUNNEL.inc(step='submit')
         form = BookingForm(request.POST)
         if form.is_valid():
             order = form.save(commit=False)
@@ -120,22 +139,24 @@ def book_car(request, pk):
             order.car = car
             
             # Вычисляем общую стоимость
-            duration = (order.end_date - order.start_date).days + 1
-            total_price = car.price_per_day * duration
-            
-            # Добавляем стоимость дополнительных услуг
-            if order.child_seat:
-                total_price += Decimal('500') * duration
-            if order.additional_driver:
-                total_price += Decimal('300') * duration
-            if order.insurance:
-                total_price += Decimal('800') * duration
-            
-            order.total_price = total_price
-            order.save()
-            
-            messages.success(request, 'Ваш заказ успешно оформлен! Мы свяжемся с вами в ближайшее время.')
-            return redirect('core:order_success', order_id=order.id)
+            extras = [name for name in pricing.EXTRAS if getattr(order, name)]
+            order.total_price = pricing.quote(car, order.start_date, order.end_date, extras).total
+            try:
+                with transaction.atomic():
+                    reserve(order)
+                    # Письма уходят из воркера; задачи коммитятся вместе с заказом
+                    jobs.enqueue('send_booking_confirmation', {'order_id': order.pk},
+                                 key=f'booking-confirmation:{order.pk}')
+                    jobs.enqueue('notify_admins_new_order', {'order_id': order.pk},
+                                 key=f'booking-admin-notification:{order.pk}')
+            except CarUnavailable:
+                metrics.BOOKING_FUNNEL.inc(step='unavailable')
+                form.add_error('start_date', 'Автомобиль уже забронирован на выбранные даты.')
+            else:
+                metrics.BOOKING_FUNNEL.inc(step='created')
+                metrics.ORDERS_CREATED.inc(status=order.status)
+                messages.success(request, 'Ваш заказ успешно оформлен! Мы свяжемся с вами в ближайшее время.')
+                return redirect('core:order_success', order_id=order.id)
     else:
         # Предзаполняем форму данными пользователя
         initial_data = {}
@@ -145,10 +166,12 @@ def book_car(request, pk):
         initial_data['email'] = request.user.email
         
         form = BookingForm(initial=initial_data)
+        metrics.BOOKING_FUNNEL.inc(step='form')
     
     context = {
         'car': car,
         'form': form,
+        'extra_prices': {name: extra['per_day'] for name, extra in pricing.EXTRAS.items()},
     }
     return render(request, 'core/book_car.html', context)
 
@@ -161,10 +184,7 @@ def order_success(request, order_id):
 
 @login_required
 def my_orders(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    paginator = Paginator(orders, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, my_orders_queryset(request.user), ORDERS_PAGE_SIZE, 'my_orders', USER_LIST_ORDERING)
     
     return render(request, 'core/my_orders.html', {'page_obj': page_obj})
 
@@ -193,13 +213,8 @@ def add_review(request, car_pk):
             review = form.save(commit=False)
             review.user = request.user
             review.car = car
-            review.save()
-            
-            # Обновляем рейтинг автомобиля
-            avg_rating = car.car_reviews.aggregate(Avg('rating'))['rating__avg']
-            car.rating = round(avg_rating, 2) if avg_rating else 0
-            car.reviews_count = car.car_reviews.count()
-            car.save()
+            review.save()  # рейтинг автомобиля обновляется в core.ratings
+            metrics.REVIEWS.inc(action='updated' if existing_review else 'created')
             
             messages.success(request, 'Ваш отзыв успешно добавлен!')
             return redirect('core:car_detail', pk=car.pk, slug=car.slug)
@@ -217,29 +232,116 @@ def add_review(request, car_pk):
 @login_required
 def toggle_favorite(request, car_pk):
     if request.method == 'POST':
-        car = get_object_or_404(Car, pk=car_pk)
-        favorite, created = Favorite.objects.get_or_create(user=request.user, car=car)
-        
-        if not created:
-            favorite.delete()
-            is_favorite = False
-        else:
-            is_favorite = True
+        result = favorite_store.toggle(request.user, car_pk)
+        if result is None:
+            raise Http404
+        is_favorite, favorites_count = result
+        metrics.FAVORITE_TOGGLES.inc(action='added' if is_favorite else 'removed')
         
         return JsonResponse({
             'is_favorite': is_favorite,
-            'favorites_count': Favorite.objects.filter(car=car).count()
+            'favorites_count': favorites_count
         })
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+@login_required
+def add_favorites(request):
+    """Добавление в избранное списком: POST {"car_ids": [1, 2, ...]}."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    try:
+        car_ids = json.loads(request.body)['car_ids']
+        # bool - подкласс int, true/false из JSON за id не считаем
+        if not isinstance(car_ids, list) or not all(
+            isinstance(pk, int) and not isinstance(pk, bool) for pk in car_ids
+        ):
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Ожидается {"car_ids": [id, ...]}'}, status=400)
+    if len(car_ids) > favorite_store.MAX_BULK_ADD:
+        return JsonResponse({'error': f'Не больше {favorite_store.MAX_BULK_ADD} автомобилей за запрос'}, status=400)
+    
+    counts = favorite_store.add_many(request.user, car_ids)
+    return JsonResponse({
+        'favorites': [
+            {'car_id': pk, 'is_favorite': True, 'favorites_count': count}
+            for pk, count in counts.items()
+        ],
+        'not_found': [pk for pk in dict.fromkeys(car_ids) if pk not in counts],
+    })
+
+
+def _parse_moment(value):
+    moment = parse_datetime(value or '')
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def price_quote(request, car_pk):
+    """
+    Расчёт стоимости для формы бронирования: ?start=...&end=...&extras=insurance&...
+
+    Тот же расчёт, что сохраняет book_car; ставки берутся из кеша без загрузки модели.
+    """
+    rates = pricing.get_rates(car_pk)
+    if rates is None:
+        return JsonResponse({'error': 'Автомобиль не найден'}, status=404)
+    try:
+        start = _parse_moment(request.GET.get('start'))
+        end = _parse_moment(request.GET.get('end'))
+    except ValueError:
+        start = end = None
+    if start is None or end is None:
+        return JsonResponse({'error': 'Укажите start и end в формате ГГГГ-ММ-ДДTЧЧ:ММ'}, status=400)
+    try:
+        pricing.check_period(start, end)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    extras = request.GET.getlist('extras')
+    unknown = [name for name in extras if name not in pricing.EXTRAS]
+    if unknown:
+        return JsonResponse({'error': f'Неизвестные услуги: {", ".join(unknown)}'}, status=400)
+    
+    return JsonResponse(pricing.quote(rates, start, end, extras).as_dict())
+
+
+@staff_member_required
+def orders_report(request):
+    """CSV заказов для бухгалтерии: ?since=ГГГГ-ММ-ДД&until=...&status=..."""
+    try:
+        since = reports.parse_moment(request.GET['since']) if request.GET.get('since') else None
+        until = reports.parse_moment(request.GET['until'], end_of_day=True) if request.GET.get('until') else None
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    orders = reports.filter_orders(Order.objects.all(), since, until, request.GET.get('status'))
+    return reports.orders_csv_response(orders)
+
+
+def metrics_view(request):
+    """Метрики для Prometheus: с METRICS_ALLOWED_IPS или по METRICS_TOKEN."""
+    token = settings.METRICS_TOKEN
+    auth = request.headers.get('Authorization', '')
+    allowed = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS or (
+        token and secrets.compare_digest(auth, f'Bearer {token}')
+    )
+    if not allowed:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def suggest(request):
+    results = suggest_index.suggest(request.GET.get('q', ''))
+    return JsonResponse({'results': results})
+
+
 @login_required
 def my_favorites(request):
-    favorites = Favorite.objects.filter(user=request.user).select_related('car')
-    paginator = Paginator(favorites, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(
+        request, my_favorites_queryset(request.user), FAVORITES_PAGE_SIZE, 'my_favorites', USER_LIST_ORDERING,
+    )
     
     return render(request, 'core/my_favorites.html', {'page_obj': page_obj})
 
@@ -251,6 +353,7 @@ def register(request):
             user = form.save()
             # Создаем профиль пользователя
             UserProfile.objects.create(user=user)
+            metrics.AUTH_EVENTS.inc(event='register')
             
             username = form.cleaned_data.get('username')
             messages.success(request, f'Аккаунт создан для {username}! Теперь вы можете войти.')
@@ -284,7 +387,7 @@ def profile(request):
     
     # Статистика пользователя
     orders_count = Order.objects.filter(user=request.user).count()
-    favorites_count = Favorite.objects.filter(user=request.user).count()
+    favorites_count = len(favorite_ids(request.user))
     reviews_count = Review.objects.filter(user=request.user).count()
     
     context = {
@@ -42,11 +42,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.profiling.ProfilingMiddleware',
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.db_routing.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -64,6 +67,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.favorites',
             ],
         },
     },
@@ -75,12 +79,162 @@ WSGI_APPLICATION = 'rentacar_n.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# В проде - PostgreSQL (POSTGRES_DB=... и остальные POSTGRES_*), с репликой
+# для чтения, если задан POSTGRES_REPLICA_HOST (core.db_routing). Локально -
+# SQLite в режиме WAL.
+
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ['POSTGRES_DB'],
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Постоянные соединения с проверкой перед переиспользованием
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
+    if os.environ.get('DB_POOL_MAX_SIZE'):
+        # Пул psycopg (pip install "psycopg[pool]"); с пулом CONN_MAX_AGE должен быть 0
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ['DB_POOL_MAX_SIZE']),
+            'timeout': 10,
+        }
+    if os.environ.get('DB_PGBOUNCER'):
+        # PgBouncer в режиме transaction не держит серверные курсоры .iterator()
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    if os.environ.get('POSTGRES_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.environ['POSTGRES_REPLICA_HOST'],
+            'PORT': os.environ.get('POSTGRES_REPLICA_PORT', DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_ROUTERS = ['core.db_routing.PrimaryReplicaRouter']
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': 60,
+            'OPTIONS': {
+                # Писатель берёт блокировку в начале транзакции, чтобы проверка
+                # пересечения заказов и вставка не разъезжались (core.availability)
+                'transaction_mode': 'IMMEDIATE',
+                # busy_timeout: сколько секунд ждать блокировку записи вместо ошибки
+                'timeout': 20,
+                # WAL: читатели не ждут писателя; synchronous=NORMAL в WAL не теряет
+                # целостность; mmap и кеш страниц уменьшают число чтений с диска
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA mmap_size=134217728;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA journal_size_limit=27103364;'
+                ),
+            },
+        }
+    }
+
+# Представления, которые читают с реплики (если она есть); остальные и
+# любые записи идут на основную базу
+DATABASE_REPLICA_VIEWS = {
+    'core:home', 'core:car_detail', 'core:my_orders', 'core:my_favorites', 'core:suggest',
+    'core:api_car_list', 'core:api_car_detail', 'core:api_car_reviews', 'core:api_categories',
 }
+# После POST клиент столько секунд читает с основной базы, чтобы видеть свои изменения
+DATABASE_REPLICA_STICKY_SECONDS = 10
+
+
+# Cache
+# Локально - память процесса, в проде - Redis (REDIS_URL=redis://host:6379/0).
+# С несколькими воркерами REDIS_URL обязателен: сброс кешей сигналами
+# (страницы, снимок каталога, подсказки) виден только через общий кеш
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Кеш фрагментов карточек автомобилей (core.fragments); None - без кеша
+CAR_CARD_CACHE = 'default'
+CAR_CARD_CACHE_TIMEOUT = 60 * 60
+
+# Кеш страниц каталога только для анонимных посетителей (core.page_cache; почему
+# не для вошедших - см. там); None - без кеша
+PAGE_CACHE = 'default'
+PAGE_CACHE_TIMEOUT = 5 * 60
+
+# Время жизни снимка каталога для главной страницы (core.catalogue)
+CATALOGUE_SNAPSHOT_TIMEOUT = 60
+# Как часто поколение каталога для ETag API сверяется с базой, если кеш
+# не общий (locmem)
+CATALOGUE_DB_CHECK_INTERVAL = 5
+
+# Как часто подсказки (core.suggest) сверяют версию каталога с базой,
+# если кеш не общий (locmem)
+SUGGEST_DB_CHECK_INTERVAL = 5
+
+# Правила цены аренды (core.pricing). Значения - предложение для бизнеса,
+# меняются здесь без правки кода.
+# Самый длинный срок аренды в днях: длиннее - 400 в /api/quote/ и
+# ошибка формы бронирования
+PRICING_MAX_DAYS = int(os.environ.get('PRICING_MAX_DAYS', 365))
+# Полная неделя аренды стоит столько суток (7 - без бесплатного дня)
+PRICING_WEEK_PRICE_IN_DAYS = 6
+# Скидка на стоимость машины: (от скольки суток, доля)
+PRICING_LONG_RENTAL_DISCOUNTS = [
+    (30, '0.15'),
+    (14, '0.10'),
+]
+# Сезонные коэффициенты: ((месяц, день) начала, (месяц, день) окончания
+# включительно, коэффициент); сезон может переходить через Новый год
+PRICING_SEASONS = [
+    ((6, 15), (8, 31), '1.2'),  # лето
+    ((12, 25), (1, 8), '1.3'),  # новогодние праздники
+]
+
+# Профилирование запросов (core.profiling): доля запросов, для которых
+# замер SQL, шаблонов и представления уходит в Server-Timing и лог
+# (0 - ни одного), порог медленного запроса в мс (медленные логируются
+# все, независимо от доли; 0 - не логировать) и сколько самых медленных
+# SQL показывать в обычной записи лога. При обоих 0 (по умолчанию)
+# middleware отключается и Template.render не подменяется
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_SLOW_REQUEST_MS = int(os.environ.get('PROFILING_SLOW_REQUEST_MS', 0))
+PROFILING_SLOWEST_QUERIES = 3
+
+# Метрики Prometheus (core.metrics) на /metrics. Доступ - с адресов из
+# METRICS_ALLOWED_IPS или с заголовком Authorization: Bearer <METRICS_TOKEN>.
+# Под несколькими процессами WSGI нужен общий каталог METRICS_DIR, куда
+# каждый процесс раз в METRICS_FLUSH_INTERVAL секунд сбрасывает снимок
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5
+
+# Кеш id избранных автомобилей пользователя (core.favorites)
+FAVORITES_CACHE_TIMEOUT = 60 * 60
+
+# Админка: списки значений фильтров кешируются, а число строк больших
+# таблиц на PostgreSQL берётся из оценки планировщика (core.pagination)
+ADMIN_FILTER_CACHE_TIMEOUT = 10 * 60
+ADMIN_COUNT_ESTIMATE_THRESHOLD = 10_000
 
 
 # Password validation
@@ -127,6 +281,16 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Уменьшенные копии загруженных фото (core.images), по хешу содержимого
+IMAGE_DERIVATIVES_URL = '/media-derived/'
+IMAGE_DERIVATIVES_ROOT = BASE_DIR / 'media_derived'
+IMAGE_WIDTHS = (300, 400, 800, 1200)
+IMAGE_FORMATS = ('avif', 'webp')
+# Потоков для генерации превью; 0 - сразу после коммита в том же процессе
+IMAGE_WORKERS = 2
+# Сколько секунд помнить, что превью ещё нет (другой процесс мог его уже сделать)
+IMAGE_DERIVATIVE_MISS_TIMEOUT = 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -136,3 +300,52 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
+
+# Очередь фоновых задач (core.jobs, manage.py run_workers)
+JOB_POLL_INTERVAL = 1.0  # секунд между проверками пустой очереди
+JOB_LOCK_TIMEOUT = 10 * 60  # после этого задачу упавшего воркера забирает другой
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 10  # секунд до первого повтора, дальше задержка удваивается
+# True - задачи выполняются сразу после коммита в том же процессе, без воркеров
+JOBS_EAGER = False
+# Сколько дней хранить выполненные и упавшие задачи; чистит run_workers
+JOB_RETENTION_DAYS = 7
+JOB_FAILED_RETENTION_DAYS = 30
+JOB_PURGE_INTERVAL = 60 * 60
+
+# Письма; по умолчанию выводятся в консоль
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'RentaCar <noreply@rentacar.local>')
+ADMINS = [
+    ('RentaCar', email) for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email
+]
+
+# Keyset-пагинация по курсору вместо номеров страниц (core.pagination)
+CURSOR_PAGINATION = {
+    'home': True,
+    'my_orders': True,
+    'my_favorites': True,
+}
+
+
+# Логи: записи профилировщика - по одной JSON-строке (core.profiling)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json_line': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'profiling': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json_line',
+        },
+    },
+    'loggers': {
+        'core.profiling': {
+            'handlers': ['profiling'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}